@@ -0,0 +1,170 @@
+"""Clients for load tests and benchmarks: in-process ASGI and plain HTTP."""
+import asyncio
+import json
+from urllib.parse import urlencode, urlsplit
+
+import h11
+
+__all__ = ["ASGIClient", "HTTPClient", "Response"]
+
+
+class Response:
+    """Minimal response returned by ASGIClient."""
+
+    def __init__(self, status_code: int, headers: dict, body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = body
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def encode_request(headers: dict = None, json_body=None, form: dict = None, content: bytes = None):
+    """Body and lower-cased raw headers of a request."""
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    body = content or b""
+    if json_body is not None:
+        body = json.dumps(json_body).encode()
+        raw_headers.append((b"content-type", b"application/json"))
+    elif form is not None:
+        body = urlencode(form).encode()
+        raw_headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+    return body, raw_headers
+
+
+class ASGIClient:
+    """Drive an ASGI application directly, without a network hop.
+
+    Unlike the starlette TestClient, requests are plain coroutines,
+    so any number of them can run concurrently on one event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(
+        self, method: str, url: str, headers: dict = None, json_body=None, form: dict = None, content: bytes = None
+    ) -> Response:
+        path, _, query = url.partition("?")
+        if not path.startswith("/"):
+            path = "/" + path
+        body, raw_headers = encode_request(headers, json_body, form, content)
+        raw_headers += [(b"host", b"testserver"), (b"content-length", str(len(body)).encode())]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        request_sent = False
+        status_code, response_headers, chunks = 500, {}, []
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                return {"type": "http.disconnect"}
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return Response(status_code, response_headers, b"".join(chunks))
+
+    async def get(self, url: str, **kwargs) -> Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> Response:
+        return await self.request("DELETE", url, **kwargs)
+
+
+class HTTPClient:
+    """HTTP/1.1 client over keep-alive connections, with the ASGIClient interface.
+
+    At most `connections` requests are in flight; the others wait for a free connection.
+    """
+
+    def __init__(self, base_url: str, connections: int = 100):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connections = asyncio.Queue()
+        for _ in range(connections):
+            self.connections.put_nowait(None)
+
+    async def request(
+        self, method: str, url: str, headers: dict = None, json_body=None, form: dict = None, content: bytes = None
+    ) -> Response:
+        if not url.startswith("/"):
+            url = "/" + url
+        body, raw_headers = encode_request(headers, json_body, form, content)
+        raw_headers += [(b"host", f"{self.host}:{self.port}".encode()), (b"content-length", str(len(body)).encode())]
+        connection = await self.connections.get()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(self.host, self.port)
+            response, connection = await self.exchange(connection, method.upper(), url, raw_headers, body)
+        except BaseException:
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            raise
+        finally:
+            self.connections.put_nowait(connection)
+        return response
+
+    @staticmethod
+    async def exchange(connection, method: str, url: str, headers: list, body: bytes):
+        reader, writer = connection
+        protocol = h11.Connection(h11.CLIENT)
+        writer.write(protocol.send(h11.Request(method=method, target=url, headers=headers)))
+        writer.write(protocol.send(h11.Data(data=body)) + protocol.send(h11.EndOfMessage()))
+        await writer.drain()
+        status_code, response_headers, chunks = 500, {}, []
+        while True:
+            event = protocol.next_event()
+            if event is h11.NEED_DATA:
+                protocol.receive_data(await reader.read(65536))
+            elif isinstance(event, h11.Response):
+                status_code = event.status_code
+                response_headers = {k.decode().lower(): v.decode() for k, v in event.headers}
+            elif isinstance(event, h11.Data):
+                chunks.append(bytes(event.data))
+            elif isinstance(event, (h11.EndOfMessage, h11.ConnectionClosed)):
+                break
+        if protocol.their_state is not h11.DONE or protocol.our_state is not h11.DONE:
+            writer.close()
+            connection = None
+        return Response(status_code, response_headers, b"".join(chunks)), connection
+
+    async def close(self):
+        while not self.connections.empty():
+            connection = self.connections.get_nowait()
+            if connection is not None:
+                connection[1].close()
+
+    async def get(self, url: str, **kwargs) -> Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> Response:
+        return await self.request("DELETE", url, **kwargs)
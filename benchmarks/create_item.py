@@ -0,0 +1,73 @@
+"""Microbenchmark: item creation with three statements versus one.
+
+"check-insert-select" replays the former create_new_item: a duplicate check,
+an ORM insert and a re-select joined with User. "insert" is the current path:
+one INSERT whose result carries the new id.
+
+Usage: python -m benchmarks.create_item --items 2000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.fixtures import benchmark_database
+from database.models import Item, User
+from main import app
+
+USER_ID = 1
+
+
+async def check_insert_select(session: AsyncSession, title: str):
+    result = await session.execute(select(Item).where(Item.title == title))
+    if result.scalars().first():
+        raise ValueError(f"{title} has been already stored")
+    session.add(Item(title=title, user_id=USER_ID))
+    await session.commit()
+    query = select(Item.id, Item.title, User.username).where(Item.title == title).join(User, User.id == USER_ID)
+    result = await session.execute(query)
+    return result.first()
+
+
+async def single_insert(session: AsyncSession, title: str):
+    result = await session.execute(insert(Item).values(title=title, user_id=USER_ID))
+    await session.commit()
+    return result.inserted_primary_key[0]
+
+
+async def run(items: int, memory: bool = True) -> list:
+    rows = []
+    async with benchmark_database(app, memory) as engine:
+        statements = 0
+
+        def count(*args):
+            nonlocal statements
+            statements += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        for name, create in (("check-insert-select", check_insert_select), ("insert", single_insert)):
+            statements = 0
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                started = time.perf_counter()
+                for i in range(items):
+                    await create(session, f"{name}-{i}")
+                elapsed = time.perf_counter() - started
+            rows.append((name, statements / items, elapsed / items * 1e6))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--disk", action="store_true", help="use a database file instead of memory")
+    args = parser.parse_args()
+
+    print(f"{'path':<20} {'statements/item':>16} {'us/item':>10}")
+    for name, statements, latency in asyncio.run(run(args.items, not args.disk)):
+        print(f"{name:<20} {statements:>16.1f} {latency:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
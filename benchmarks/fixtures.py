@@ -0,0 +1,67 @@
+"""Throwaway databases for benchmarks."""
+import os
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from config import get_settings
+from database.engine import (
+    create_read_engine,
+    create_write_engine,
+    get_read_session,
+    get_session,
+    keep_alive,
+    memory_database_url,
+)
+from database.models import main
+
+
+@asynccontextmanager
+async def benchmark_database(app, memory: bool = True):
+    """Create a temporary database loaded with test fixtures and route the app to it.
+
+    The database lives in memory unless `memory` is false, so that benchmarks
+    can run in parallel processes. The engines use the same pools and pragmas as the production ones.
+
+    :return the writer engine
+    """
+    settings = get_settings()
+    if memory:
+        path = None
+        url = memory_database_url(f"owm-benchmark-{os.getpid()}-{uuid.uuid4().hex}")
+    else:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = "sqlite:///" + path
+    anchor = keep_alive(url)
+    engine = create_write_engine(url, settings)
+    read_engine = create_read_engine(url, settings)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    read_session_factory = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_benchmark_session():
+        async with session_factory() as session:
+            yield session
+
+    async def get_benchmark_read_session():
+        async with read_session_factory() as session:
+            yield session
+
+    await main(test=True, bind=engine)
+    app.dependency_overrides[get_session] = get_benchmark_session
+    app.dependency_overrides[get_read_session] = get_benchmark_read_session
+    try:
+        yield engine
+    finally:
+        del app.dependency_overrides[get_session]
+        del app.dependency_overrides[get_read_session]
+        await engine.dispose()
+        await read_engine.dispose()
+        if anchor:
+            anchor.close()
+        for suffix in ("", "-wal", "-shm"):
+            if path and os.path.exists(path + suffix):
+                os.remove(path + suffix)
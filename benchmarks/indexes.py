@@ -0,0 +1,106 @@
+"""Benchmark: hot lookups with and without the schema indexes.
+
+Fills a scratch SQLite database with synthetic users and items, times the
+lookups issued by the handlers as full scans, then creates the indexes
+declared on the models and times them again.
+
+Usage: python -m benchmarks.indexes --users 1000000 --items 10000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from database.migrations import create_missing_indexes
+from database.models import Base
+
+LOOKUPS = {
+    "user by username": "SELECT id FROM user WHERE username = ?",
+    "item by title": "SELECT id FROM item WHERE title = ?",
+    "items by user_id": "SELECT id, title FROM item WHERE user_id = ?",
+}
+
+
+def fill(path: str, users: int, items: int, batch: int = 100000):
+    """Create tables without indexes and insert synthetic rows."""
+    engine = create_engine("sqlite:///" + path)
+    for table in Base.metadata.sorted_tables:
+        table.create(engine)
+        for index in table.indexes:
+            index.drop(engine)
+    engine.dispose()
+
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    for start in range(0, users, batch):
+        rows = ((i + 1, f"user{i}", "hash") for i in range(start, min(start + batch, users)))
+        connection.executemany("INSERT INTO user (id, username, password) VALUES (?, ?, ?)", rows)
+    for start in range(0, items, batch):
+        rows = ((i + 1, f"item{i}", i % users + 1) for i in range(start, min(start + batch, items)))
+        connection.executemany("INSERT INTO item (id, title, user_id) VALUES (?, ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def time_lookups(path: str, users: int, items: int, repeat: int) -> dict:
+    """Median latency of every lookup in milliseconds."""
+    connection = sqlite3.connect(path)
+    arguments = {
+        "user by username": lambda: f"user{random.randrange(users)}",
+        "item by title": lambda: f"item{random.randrange(items)}",
+        "items by user_id": lambda: random.randrange(users) + 1,
+    }
+    results = {}
+    for name, sql in LOOKUPS.items():
+        samples = []
+        for _ in range(repeat):
+            argument = arguments[name]()
+            started = time.perf_counter()
+            connection.execute(sql, (argument,)).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(samples)
+    connection.close()
+    return results
+
+
+def create_indexes(path: str):
+    engine = create_engine("sqlite:///" + path)
+    with engine.begin() as connection:
+        create_missing_indexes(connection)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--items", type=int, default=10000000)
+    parser.add_argument("--scan-repeat", type=int, default=5, help="lookups timed without indexes")
+    parser.add_argument("--repeat", type=int, default=1000, help="lookups timed with indexes")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    try:
+        started = time.perf_counter()
+        fill(path, args.users, args.items)
+        print(f"Loaded {args.users} users and {args.items} items in {time.perf_counter() - started:.1f}s")
+        scans = time_lookups(path, args.users, args.items, args.scan_repeat)
+        create_indexes(path)
+        indexed = time_lookups(path, args.users, args.items, args.repeat)
+    finally:
+        os.remove(path)
+
+    print(f"{'lookup':<20} {'no index, ms':>14} {'indexed, ms':>14}")
+    for name in LOOKUPS:
+        print(f"{name:<20} {scans[name]:>14.3f} {indexed[name]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
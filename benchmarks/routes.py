@@ -0,0 +1,239 @@
+"""Benchmark suite: latency and throughput of every API route under a scripted scenario.
+
+Every virtual user registers, logs in, creates items, lists items and users,
+then sends an item to the next user, who claims it. Each step is a phase run
+for all users with at most `--concurrency` requests in flight, so the
+throughput of a route is its requests divided by the duration of its phase.
+
+The app is driven in-process through ASGI (`--target asgi`) or over HTTP
+through a local uvicorn worker (`--target uvicorn`). Both use a fresh
+in-memory database. The report is JSON; pass a previous one as `--baseline`
+to fail on p95 latency or throughput regressions beyond `--tolerance`.
+
+Usage: python -m benchmarks.routes --users 200 --items 10 --concurrency 32 --output report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from benchmarks.client import ASGIClient, HTTPClient
+from benchmarks.fixtures import benchmark_database
+from database.engine import memory_database_url
+from main import app
+
+PASSWORD = "Qwerty123_"
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+class Recorder:
+    """Latencies and failures of the requests to one route."""
+
+    def __init__(self):
+        self.latencies = []
+        self.failures = 0
+        self.elapsed = 0.0
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        return {
+            "requests": requests,
+            "failures": self.failures,
+            "rps": requests / self.elapsed if self.elapsed else 0.0,
+            "mean_ms": sum(latencies) / requests * 1000 if requests else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+
+class Scenario:
+    """Scripted session of `users` virtual users against one client."""
+
+    def __init__(self, client, users: int, items: int, concurrency: int):
+        self.client = client
+        self.users = [f"bench{uuid.uuid4().hex[:8]}{i}" for i in range(users)]
+        self.items = items
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.routes = {}
+        self.tokens = {}
+        self.item_ids = {}
+        self.links = {}
+
+    async def call(self, route: str, expected: int, method: str, url: str, **kwargs):
+        """Send one request and record it under the route; return the response or None on failure."""
+        recorder = self.routes.setdefault(route, Recorder())
+        async with self.semaphore:
+            started = time.perf_counter()
+            response = await self.client.request(method, url, **kwargs)
+            recorder.latencies.append(time.perf_counter() - started)
+        if response.status_code != expected:
+            recorder.failures += 1
+            return None
+        return response
+
+    async def phase(self, route: str, steps):
+        """Run the steps of one route concurrently and time the whole phase."""
+        started = time.perf_counter()
+        await asyncio.gather(*steps)
+        self.routes.setdefault(route, Recorder()).elapsed += time.perf_counter() - started
+
+    def headers(self, user: str) -> dict:
+        return {"Authorization": f"Bearer {self.tokens.get(user, '')}"}
+
+    async def register(self, user: str):
+        payload = {"username": user, "password": PASSWORD}
+        await self.call("POST /registration", 201, "POST", "/api/v1/registration", json_body=payload)
+
+    async def login(self, user: str):
+        form = {"username": user, "password": PASSWORD}
+        response = await self.call("POST /login", 200, "POST", "/api/v1/login", form=form)
+        if response:
+            self.tokens[user] = response.json()["access_token"]
+
+    async def create_item(self, user: str, number: int):
+        payload = {"title": f"{user}-item{number}"}
+        headers = self.headers(user)
+        response = await self.call(
+            "POST /items/new", 201, "POST", "/api/v1/items/new", json_body=payload, headers=headers
+        )
+        if response:
+            self.item_ids.setdefault(user, []).append(response.json()["item"]["id"])
+
+    async def list_items(self, user: str):
+        await self.call("GET /items/", 200, "GET", "/api/v1/items/", headers=self.headers(user))
+
+    async def list_users(self, user: str):
+        await self.call("GET /users", 200, "GET", f"/api/v1/users?prefix={user[:7]}", headers=self.headers(user))
+
+    async def send(self, user: str, achiever: str):
+        if not self.item_ids.get(user):
+            return
+        payload = {"item_id": self.item_ids[user][0], "achiever": achiever}
+        response = await self.call(
+            "POST /send", 200, "POST", "/api/v1/send", json_body=payload, headers=self.headers(user)
+        )
+        if response:
+            self.links[achiever] = response.json()["link"]
+
+    async def claim(self, user: str):
+        if user in self.links:
+            await self.call("GET /get", 200, "GET", self.links[user], headers=self.headers(user))
+
+    async def run(self) -> dict:
+        users = self.users
+        await self.phase("POST /registration", (self.register(user) for user in users))
+        await self.phase("POST /login", (self.login(user) for user in users))
+        await self.phase("POST /items/new", (self.create_item(u, n) for u in users for n in range(self.items)))
+        await self.phase("GET /items/", (self.list_items(user) for user in users))
+        await self.phase("GET /users", (self.list_users(user) for user in users))
+        achievers = users[1:] + users[:1]
+        await self.phase("POST /send", (self.send(user, achiever) for user, achiever in zip(users, achievers)))
+        await self.phase("GET /get", (self.claim(user) for user in users))
+        return {route: recorder.report() for route, recorder in self.routes.items()}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_server(startup_timeout: float = 30.0):
+    """Run main:app on a local uvicorn worker with its own in-memory database.
+
+    :return base URL of the server
+    """
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=memory_database_url("owm-benchmark"))
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, env=env)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def run(target: str, users: int, items: int, concurrency: int) -> dict:
+    """Run the scenario once against the target and return the JSON report."""
+    if target == "asgi":
+        async with benchmark_database(app):
+            routes = await Scenario(ASGIClient(app), users, items, concurrency).run()
+    else:
+        async with uvicorn_server() as base_url:
+            client = HTTPClient(base_url, connections=concurrency)
+            try:
+                routes = await Scenario(client, users, items, concurrency).run()
+            finally:
+                await client.close()
+    return {"target": target, "users": users, "items": items, "concurrency": concurrency, "routes": routes}
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """Routes whose p95 latency grew or throughput fell by more than `tolerance` against the baseline."""
+    found = []
+    for route, current in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            found.append(f"{route}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            found.append(f"{route}: {previous['rps']:.1f} -> {current['rps']:.1f} req/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--items", type=int, default=10, help="items created by every user")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", help="write the JSON report to a file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.target, args.users, args.items, args.concurrency))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Microbenchmark: serializing a page of item rows.
+
+"jsonable_encoder" is the former get_items path: the Row list is walked by
+FastAPI's jsonable_encoder and rendered by JSONResponse with json.dumps.
+"orjson" is the current one: plain dicts built from the row tuples rendered
+by ORJSONResponse.
+
+Usage: python -m benchmarks.serialization --items 100000
+"""
+import argparse
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import create_engine, insert, select
+
+from database.models import Base, Item
+
+USERNAME = "user1"
+
+
+def fetch_rows(items: int) -> list:
+    """Rows of a scratch in-memory database, as get_items fetches them."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Item), [{"title": f"item-{i}", "user_id": 1} for i in range(items)])
+        return connection.execute(select(Item.id, Item.title).order_by(Item.id)).fetchall()
+
+
+def jsonable_encoder_path(rows: list) -> bytes:
+    return JSONResponse(jsonable_encoder({USERNAME: rows, "next_cursor": None})).body
+
+
+def orjson_path(rows: list) -> bytes:
+    items = [{"id": id_, "title": title} for id_, title in rows]
+    return ORJSONResponse({USERNAME: items, "next_cursor": None}).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = fetch_rows(args.items)
+    assert jsonable_encoder_path(rows[:10]).replace(b" ", b"") == orjson_path(rows[:10])
+    print(f"{'path':<18} {'median ms':>10} {'MB':>6}")
+    for name, serialize in (("jsonable_encoder", jsonable_encoder_path), ("orjson", orjson_path)):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            body = serialize(rows)
+            timings.append(time.perf_counter() - started)
+        print(f"{name:<18} {statistics.median(timings) * 1000:>10.1f} {len(body) / 1e6:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
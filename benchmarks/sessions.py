@@ -0,0 +1,58 @@
+"""Load test: throughput of authenticated reads at growing concurrency.
+
+Every request runs in its own session checked out of the pool, so
+throughput should grow with concurrency until the pool (or the database)
+is saturated.
+
+Usage: python -m benchmarks.sessions --requests 2000 --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.client import ASGIClient
+from benchmarks.fixtures import benchmark_database
+from main import app
+
+
+async def run_level(client: ASGIClient, headers: dict, requests: int, concurrency: int) -> dict:
+    """Fire `requests` GETs with at most `concurrency` of them in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            url = "/api/v1/items/" if i % 2 else "/api/v1/users"
+            response = await client.get(url, headers=headers)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": requests, "failures": failures, "rps": requests / elapsed}
+
+
+async def run(requests: int, levels: list, memory: bool = True) -> list:
+    client = ASGIClient(app)
+    async with benchmark_database(app, memory):
+        response = await client.post("/api/v1/login", form={"username": "testuser1", "password": "Qwerty123_"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return [await run_level(client, headers, requests, level) for level in levels]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--disk", action="store_true", help="use a database file instead of memory")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>12} {'requests':>10} {'failures':>10} {'req/s':>10}")
+    for row in asyncio.run(run(args.requests, args.concurrency, not args.disk)):
+        print(f"{row['concurrency']:>12} {row['requests']:>10} {row['failures']:>10} {row['rps']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
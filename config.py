@@ -8,12 +8,93 @@ from pydantic import BaseSettings
 
 load_dotenv()
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 
 class Settings(BaseSettings):
     """Base app settings."""
 
     SECRET_KEY: str = os.getenv("SECRET_KEY", "TEST_KEY")
 
+    # "sqlite:///file:<name>?mode=memory&cache=shared&uri=true" keeps the database in memory
+    DATABASE_URL: str = "sqlite:///" + os.path.join(basedir, "database", "prod.db")
+
+    # Read-only connection pool; writes always go through a single connection
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_PRE_PING: bool = True
+
+    # SQLite tuning profile, applied with PRAGMAs to every new connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT: int = 5000  # ms
+    SQLITE_CACHE_SIZE: int = -65536  # negative: KiB
+    SQLITE_MMAP_SIZE: int = 268435456  # bytes
+    SQLITE_TEMP_STORE: str = "MEMORY"
+
+    # Request, database and hashing pool metrics served on /metrics
+    METRICS_ENABLED: bool = True
+    # Statements slower than this are logged with their parameters and route
+    SLOW_QUERY_MS: float = 100.0
+    # Debug mode adds a Server-Timing header with the queries of each request
+    DEBUG: bool = False
+
+    # Requests with a signed X-Profile-Token header are sampled every PROFILING_INTERVAL seconds;
+    # profiles are written to PROFILING_DIR, or returned as the response when it is empty
+    PROFILING_ENABLED: bool = False
+    PROFILING_DIR: str = ""
+    PROFILING_INTERVAL: float = 0.001
+
+    # Authenticated principals cached by access token
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 60.0
+
+    # Verify tokens against in-memory user token generations instead of the stored tokens;
+    # a login on another worker is seen through the invalidation bus, or once one of its tokens is looked up
+    STATELESS_TOKENS: bool = False
+
+    # Cache invalidation events shared by the workers through the cache_event table
+    INVALIDATION_ENABLED: bool = True
+    INVALIDATION_POLL_INTERVAL: float = 0.5
+    INVALIDATION_RETENTION: float = 3600.0
+
+    # bcrypt hashing pool: "thread" or "process" workers and a bounded queue
+    HASH_POOL_KIND: str = "thread"
+    HASH_POOL_WORKERS: int = 4
+    HASH_POOL_QUEUE_SIZE: int = 64
+
+    # GET /items pagination
+    ITEMS_PAGE_SIZE: int = 100
+    ITEMS_PAGE_SIZE_MAX: int = 1000
+    ITEMS_STREAM_CHUNK: int = 1000
+
+    # POST /items/bulk: rows per multi-row INSERT (2 bound parameters each) and items per request
+    BULK_BATCH_SIZE: int = 400
+    BULK_MAX_ITEMS: int = 50000
+
+    # Fixture loader: rows per executemany and processes hashing plain passwords
+    FIXTURE_BATCH_SIZE: int = 1000
+    FIXTURE_HASH_WORKERS: int = 1
+
+    # GET /users pagination and full list cache
+    USERS_PAGE_SIZE: int = 100
+    USERS_PAGE_SIZE_MAX: int = 1000
+    USERS_CACHE_TTL: float = 300.0
+
+    # Pending item transfers: lifetime of an offer, sweeping of expired ones and incoming pages
+    TRANSFER_TTL: float = 7 * 24 * 3600.0
+    TRANSFER_SWEEP_INTERVAL: float = 300.0
+    TRANSFER_SWEEP_BATCH: int = 1000
+    TRANSFERS_PAGE_SIZE: int = 100
+    TRANSFERS_PAGE_SIZE_MAX: int = 1000
+
+    # Event push: queued events per connection, idle heartbeat, items listed in one event
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_HEARTBEAT: float = 15.0
+    EVENTS_MAX_ITEMS: int = 100
+
 
 @lru_cache()
 def get_settings():
@@ -1,10 +1,147 @@
-"""Database engine module."""
-import os
+"""Database engine module.
 
+SQLite allows a single writer at a time, so there are two engines:
+
+- ``engine`` holds one connection. Write units of work queue for it
+  asynchronously instead of blocking the event loop in SQLite's busy handler.
+- ``read_engine`` is a pool of read-only connections for the GET endpoints.
+  With WAL journaling readers never wait for the writer.
+
+The location comes from ``DATABASE_URL``. A shared-cache in-memory URL (see
+``memory_database_url``) keeps the whole database in RAM, shared by both
+engines of one process; it lives while its ``keep_alive`` connection is open.
+"""
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import Settings, get_settings
+from services.metrics import instrument_engine
+
+settings = get_settings()
+
+
+def memory_database_url(name: str) -> str:
+    """URL of a named in-memory database shared by all connections of the process."""
+    return f"sqlite:///file:{name}?mode=memory&cache=shared&uri=true"
+
+
+def is_memory_url(url: str) -> bool:
+    """Whether the URL points to an in-memory database."""
+    database = make_url(url).database or ":memory:"
+    return database == ":memory:" or "mode=memory" in url
+
+
+def keep_alive(url: str):
+    """Open a plain connection holding an in-memory database alive until it is closed.
+
+    :return sqlite3 connection, or None for file databases
+    """
+    if not is_memory_url(url):
+        return None
+    args, kwargs = SQLiteDialect_pysqlite().create_connect_args(make_url(url))
+    return sqlite3.connect(*args, **dict(kwargs, check_same_thread=False))
+
+
+def sqlite_pragmas(settings: Settings, url: str = None) -> dict:
+    """Tuning profile applied to every new connection.
+
+    In-memory databases have no journal file nor pages to map.
+    """
+    pragmas = {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+    if url and is_memory_url(url):
+        for name in ("journal_mode", "synchronous", "mmap_size"):
+            del pragmas[name]
+    return pragmas
+
+
+def set_pragmas(engine, pragmas: dict, read_only: bool = False, read_uncommitted: bool = False):
+    """Run PRAGMAs on every connection the engine opens.
+
+    :param read_uncommitted: read without table locks, seeing what the writer has not committed yet
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        if read_uncommitted:
+            cursor.execute("PRAGMA read_uncommitted=ON")
+        cursor.close()
+
+    return engine
+
+
+def create_write_engine(url: str, settings: Settings):
+    """Engine with a single serialized writer connection."""
+    engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={"check_same_thread": False},
+    )
+    return instrument_engine(set_pragmas(engine, sqlite_pragmas(settings, url)), settings.SLOW_QUERY_MS / 1000)
+
+
+def create_read_engine(url: str, settings: Settings):
+    """Engine with a pool of read-only connections.
+
+    Readers of a file database see committed data only. Readers of an in-memory database share
+    its cache with the writer, whose writes would fail at once on their table locks: they read
+    uncommitted, so they may see a write that is rolled back afterwards, an item_version
+    bump and the ETag built from it included.
+    """
+    engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={"check_same_thread": False},
+    )
+    engine = set_pragmas(engine, sqlite_pragmas(settings, url), read_only=True, read_uncommitted=is_memory_url(url))
+    return instrument_engine(engine, settings.SLOW_QUERY_MS / 1000)
+
+
+anchor = keep_alive(settings.DATABASE_URL)
+engine = create_write_engine(settings.DATABASE_URL, settings)
+read_engine = create_read_engine(settings.DATABASE_URL, settings)
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+async_read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_session():
+    """Yield a writer session bound to the current request.
+
+    Every request gets its own unit of work. The writer connection is taken
+    at the first statement and given back on commit or when the response has been sent.
+    """
+    async with async_session() as session:
+        yield session
 
 
-basedir = os.path.abspath(os.path.dirname(__file__))
-filename = os.path.join(basedir, "prod.db")
-engine = create_async_engine("sqlite:///" + filename, echo=False)
-session = AsyncSession(engine)
+async def get_read_session():
+    """Yield a read-only session bound to the current request."""
+    async with async_read_session() as session:
+        yield session
@@ -0,0 +1,174 @@
+"""Streaming fixture loader.
+
+The fixture file is a JSON array of ``{"model": ..., "fields": {...}}`` records.
+It is read incrementally and inserted in batches with one executemany per
+batch, so memory use doesn't depend on the size of the file. Run
+
+    python -m database.loader database/fixtures/initial_load.json --workers 8
+
+to seed the database. Passwords of records with ``"hashed": true`` (or of
+every record with ``--hashed``) are stored as they are; the others are hashed
+with bcrypt, in parallel processes when there are several workers.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import insert
+
+from config import get_settings
+from database.engine import engine
+from database.models import Base, Item, User
+from services.hashing import HashPool, pwd_context
+
+__all__ = ["FixtureError", "iter_records", "load_fixture"]
+
+TABLES = {"User": User.__table__, "Item": Item.__table__}
+
+
+class FixtureError(Exception):
+    """Fixture file can't be loaded."""
+
+    pass
+
+
+def iter_records(file, chunk_size: int = 1 << 16):
+    """Yield the objects of a top-level JSON array without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+    opened = False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (opened and buffer[position] == ",")):
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise FixtureError("Unexpected end of fixture file")
+            buffer, position = file.read(chunk_size), 0
+            eof = not buffer
+            continue
+        if not opened:
+            if buffer[position] != "[":
+                raise FixtureError("Fixture file must contain a JSON array")
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise FixtureError(f"Malformed fixture record: {buffer[position:][:80]!r}")
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield record
+        position = end
+
+
+def user_row(fields: dict, hashed: bool) -> dict:
+    return {
+        "username": fields["username"],
+        "password": fields["password"],
+        "hashed": hashed or fields.get("hashed", False),
+    }
+
+
+def insert_rows(connection, table, rows: list):
+    connection.execute(insert(table), rows)
+
+
+async def hash_passwords(rows: list, pool: HashPool = None):
+    """Replace plain passwords of the batch with bcrypt hashes."""
+    plain = [row for row in rows if not row.pop("hashed")]
+    if pool is None:
+        hashes = [pwd_context.hash(row["password"]) for row in plain]
+    else:
+        hashes = await asyncio.gather(*(pool.hash(row["password"]) for row in plain))
+    for row, password_hash in zip(plain, hashes):
+        row["password"] = password_hash
+
+
+async def load_fixture(
+    path: str,
+    bind=engine,
+    batch_size: int = None,
+    workers: int = None,
+    hashed: bool = False,
+    progress=None,
+) -> int:
+    """Insert every record of the fixture file in batches of consecutive records of one model.
+
+    :param hashed: all passwords in the file are already hashed
+    :param progress: called with (rows loaded, seconds elapsed) after each batch
+    :return number of rows loaded
+    """
+    settings = get_settings()
+    batch_size = batch_size or settings.FIXTURE_BATCH_SIZE
+    workers = workers or settings.FIXTURE_HASH_WORKERS
+    pool = HashPool(workers=workers, queue_size=batch_size, kind="process") if workers > 1 else None
+    started = time.perf_counter()
+    loaded = 0
+    model, rows = None, []
+
+    async def flush():
+        nonlocal loaded
+        if model == "User":
+            await hash_passwords(rows, pool)
+        async with bind.begin() as connection:
+            await connection.run_sync(insert_rows, TABLES[model], rows)
+        loaded += len(rows)
+        if progress:
+            progress(loaded, time.perf_counter() - started)
+
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for record in iter_records(file):
+                if record.get("model") not in TABLES:
+                    raise FixtureError(f"Unknown model in fixture record: {record}")
+                if rows and (record["model"] != model or len(rows) >= batch_size):
+                    await flush()
+                    rows = []
+                model = record["model"]
+                fields = record["fields"]
+                rows.append(user_row(fields, hashed) if model == "User" else fields)
+            if rows:
+                await flush()
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+    return loaded
+
+
+def print_progress(rows: int, elapsed: float):
+    print(f"{rows} rows loaded, {rows / elapsed if elapsed else 0:.0f} rows/s", flush=True)
+
+
+async def seed(path: str, reset: bool, **kwargs) -> int:
+    async with engine.begin() as connection:
+        if reset:
+            await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    return await load_fixture(path, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a fixture file into the database.")
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="processes hashing passwords")
+    parser.add_argument("--hashed", action="store_true", help="passwords in the file are already hashed")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate the tables first")
+    args = parser.parse_args()
+    asyncio.run(
+        seed(
+            args.path,
+            args.reset,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            hashed=args.hashed,
+            progress=print_progress,
+        )
+    )
@@ -0,0 +1,67 @@
+"""Bring an existing database up to the current schema.
+
+Databases created before the indexes were declared on the models lack them,
+because metadata.create_all never alters existing tables. Run
+
+    python -m database.migrations
+
+to create every missing index. Unique indexes can't be built over duplicate
+values, so duplicates are reported instead and have to be resolved by hand.
+"""
+import asyncio
+
+from sqlalchemy import func, inspect, select
+
+from database.engine import engine
+from database.models import Base
+
+__all__ = ["MigrationError", "migrate"]
+
+
+class MigrationError(Exception):
+    """Migration can't be applied to the data as it is."""
+
+    pass
+
+
+def _find_duplicates(connection, index):
+    columns = list(index.columns)
+    query = select(*columns, func.count()).group_by(*columns).having(func.count() > 1).limit(10)
+    return connection.execute(query).fetchall()
+
+
+def create_missing_indexes(connection) -> list:
+    """Create indexes declared on the models but absent in the database.
+
+    :return names of the created indexes
+    :raise MigrationError: duplicates prevent a unique index
+    """
+    inspector = inspect(connection)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            table.create(connection)
+            created.extend(index.name for index in table.indexes)
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing:
+                continue
+            if index.unique:
+                duplicates = _find_duplicates(connection, index)
+                if duplicates:
+                    raise MigrationError(f"Can't create unique index {index.name}, duplicated values: {duplicates}")
+            index.create(connection)
+            created.append(index.name)
+    return created
+
+
+async def migrate(bind=engine) -> list:
+    """Apply the migration in one transaction."""
+    async with bind.begin() as connection:
+        return await connection.run_sync(create_missing_indexes)
+
+
+if __name__ == "__main__":
+    names = asyncio.run(migrate())
+    print(f"Created indexes: {', '.join(names)}" if names else "Database is up to date")
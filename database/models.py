@@ -1,20 +1,17 @@
 """Database tables."""
 
 import asyncio
-import json
 import os
 
-from passlib.context import CryptContext
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.future import select
 
-from database.engine import engine, session
+from database.engine import engine
+from services.hashing import pwd_context
 
 Base = declarative_base()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class User(Base):
     """Table for storing users."""
@@ -22,13 +19,13 @@ class User(Base):
     __tablename__ = "user"
     __table_args__ = {"extend_existing": True}
     id = Column(Integer, primary_key=True, autoincrement=True)
-    username = Column(String(255), nullable=False)
+    username = Column(String(255), nullable=False, unique=True, index=True)
     password = Column(String(255), nullable=False)
 
-    def __init__(self, username: str, password: str, id_: int = None):
+    def __init__(self, username: str, password: str, id_: int = None, hashed: bool = False):
         self.id = id_
         self.username = username
-        self.password = self.get_password_hash(password)
+        self.password = password if hashed else self.get_password_hash(password)
 
     def __repr__(self):
         return f"{__class__.__name__}({self.username})"
@@ -45,12 +42,13 @@ class Item(Base):
     """Table for storing items.
 
     One item can be bound to one user only.
+    Item titles are unique across all users.
     """
 
     __tablename__ = "item"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(String(255), nullable=False)
-    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    title = Column(String(255), nullable=False, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False, index=True)
 
     def __init__(self, title: str, user_id: int, id_: int = None):
         self.id = id_
@@ -58,6 +56,18 @@ class Item(Base):
         self.user_id = user_id
 
 
+class ItemVersion(Base):
+    """Table of the version of every user's item list.
+
+    Bumped in the transaction of every change to the user's items, so an unchanged version
+    means an unchanged list. Users whose items never changed have no row: their version is 0.
+    """
+
+    __tablename__ = "item_version"
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class UserToken(Base):
     """Table for storing users' access tokens.
 
@@ -75,21 +85,53 @@ class UserToken(Base):
         self.user_id = user_id
 
 
-async def main(test: bool = False):
+class PendingTransfer(Base):
+    """Table of items offered to other users and not claimed yet.
+
+    One offer per item and achiever: sending the item again renews it. Offers are used once
+    and purged after they expire.
+    """
+
+    __tablename__ = "pending_transfer"
+    __table_args__ = (Index("ix_pending_transfer_item_achiever", "item_id", "achiever_id", unique=True),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    item_id = Column(Integer, ForeignKey("item.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    achiever_id = Column(Integer, ForeignKey("user.id"), nullable=False, index=True)
+    expires = Column(Float, nullable=False, index=True)
+
+
+class CacheEvent(Base):
+    """Table of cache invalidation events published to the other workers.
+
+    AUTOINCREMENT keeps ids growing even after the latest events have been pruned.
+    """
+
+    __tablename__ = "cache_event"
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    channel = Column(String(32), nullable=False)
+    key = Column(String(1024), nullable=False, default="")
+    origin = Column(String(64), nullable=False)
+    created = Column(Float, nullable=False)
+
+    def __init__(self, channel: str, key: str, origin: str, created: float):
+        self.channel = channel
+        self.key = key
+        self.origin = origin
+        self.created = created
+
+
+async def main(test: bool = False, bind=engine):
     """Create database and fill it with basic inserts."""
-    async with engine.begin() as conn:
+    from database.loader import load_fixture
+
+    async with bind.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
-    table_to_model_mapping = {"User": User, "Item": Item}
     filename = "initial_load.json" if not test else "test_load.json"
-    with open(os.path.join(os.path.dirname(__file__), "fixtures", filename), "r", encoding="utf-8") as f:
-        load = [table_to_model_mapping[dic["model"]](**dic["fields"]) for dic in json.load(f)]
-
-    async with session:
-        for model in load:
-            session.add(model)
-        await session.commit()
+    await load_fixture(os.path.join(os.path.dirname(__file__), "fixtures", filename), bind=bind)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,37 @@
-"""Models for mapping request data."""
+"""Models for mapping request and response data."""
+from typing import Dict, List, Optional, Union
+
+from pydantic import root_validator
 from pydantic.main import BaseModel
 
-__all__ = ["UserData", "ItemData", "TransferData"]
+__all__ = [
+    "UserData",
+    "CurrentUser",
+    "ItemData",
+    "TransferData",
+    "BulkDeleteData",
+    "Message",
+    "Token",
+    "ItemOut",
+    "ItemsPage",
+    "CreatedItem",
+    "ItemCreated",
+    "BulkItemResult",
+    "BulkResult",
+    "TransferLink",
+    "TransferResult",
+    "BulkDeleted",
+    "IncomingTransfer",
+    "IncomingTransfers",
+    "UsersPage",
+]
+
+
+def exactly_one(values: dict, *names: str) -> dict:
+    """Validate that one and only one of the fields is given."""
+    if sum(values.get(name) is not None for name in names) != 1:
+        raise ValueError(f"Exactly one of {', '.join(names)} is required")
+    return values
 
 
 class UserData(BaseModel):
@@ -11,6 +41,13 @@ class UserData(BaseModel):
     password: str
 
 
+class CurrentUser(BaseModel):
+    """Authenticated user resolved from an access token."""
+
+    id: int
+    username: str
+
+
 class ItemData(BaseModel):
     """Map item data from request."""
 
@@ -18,7 +55,130 @@ class ItemData(BaseModel):
 
 
 class TransferData(BaseModel):
-    """Map item exchange data from request."""
+    """Map item exchange data from request.
 
-    item_id: int
+    Exactly one of an item id, a list of item ids or a title prefix ("" for all items) is expected.
+    """
+
+    item_id: Optional[int]
+    item_ids: Optional[List[int]]
+    title_prefix: Optional[str]
     achiever: str
+
+    _one_selection = root_validator(skip_on_failure=True, allow_reuse=True)(
+        lambda cls, values: exactly_one(values, "item_id", "item_ids", "title_prefix")
+    )
+
+
+class BulkDeleteData(BaseModel):
+    """Map bulk deletion data from request: item ids or a LIKE pattern of titles ("%" and "_" wildcards)."""
+
+    item_ids: Optional[List[int]]
+    title_pattern: Optional[str]
+
+    _one_selection = root_validator(skip_on_failure=True, allow_reuse=True)(
+        lambda cls, values: exactly_one(values, "item_ids", "title_pattern")
+    )
+
+
+class Message(BaseModel):
+    """Outcome of an action."""
+
+    message: str
+
+
+class Token(BaseModel):
+    """Access token issued on login."""
+
+    access_token: str
+    token_type: str
+
+
+class ItemOut(BaseModel):
+    """Item in a list."""
+
+    id: int
+    title: str
+
+
+class ItemsPage(BaseModel):
+    """Page of the user's items under their username, with the cursor of the next page under `next_cursor`."""
+
+    __root__: Dict[str, Union[List[ItemOut], Optional[int]]]
+
+
+class CreatedItem(BaseModel):
+    """Item with its owner."""
+
+    id: int
+    title: str
+    username: str
+
+
+class ItemCreated(BaseModel):
+    """Result of an item creation."""
+
+    message: str
+    item: CreatedItem
+
+
+class BulkItemResult(BaseModel):
+    """Status of one item of a bulk creation; duplicates have no id."""
+
+    id: Optional[int]
+    title: str
+    status: str
+
+
+class BulkResult(BaseModel):
+    """Result of a bulk creation in the order of the request."""
+
+    created: int
+    duplicates: int
+    items: List[BulkItemResult]
+
+
+class TransferLink(BaseModel):
+    """Link the achiever follows to obtain the items."""
+
+    link: str
+    items: int = 1
+
+
+class TransferResult(BaseModel):
+    """Outcome of a multi-item transfer: items no longer owned by the sender are skipped."""
+
+    message: str
+    transferred: List[int]
+    skipped: List[int]
+
+
+class BulkDeleted(BaseModel):
+    """Number of items a bulk deletion removed."""
+
+    deleted: int
+
+
+class IncomingTransfer(BaseModel):
+    """Item offered to the user, with the link to claim it and the expiry time (unix seconds)."""
+
+    id: int
+    item_id: int
+    title: str
+    sender: str
+    expires: int
+    link: str
+
+
+class IncomingTransfers(BaseModel):
+    """Page of incoming transfers."""
+
+    transfers: List[IncomingTransfer]
+    next_cursor: Optional[int]
+
+
+class UsersPage(BaseModel):
+    """Page of usernames."""
+
+    existing_users: List[str]
+    next_cursor: Optional[str]
@@ -1,11 +1,21 @@
 """Main module."""
 
 import uvicorn
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 
+from config import get_settings
+from database.engine import is_memory_url
+from database.models import main as create_database
+from services.hashing import HashPoolBusy, hash_pool
+from services.invalidation import bus
+from services.metrics import MetricsMiddleware, ServerTimingMiddleware
+from services.profiling import ProfilingMiddleware
+from services.transfers import sweeper
+from validators.authentication import load_token_generations
 from views import *
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 root_router = APIRouter(prefix="/api/v1")
 
@@ -14,8 +24,46 @@ root_router.include_router(login_router)
 root_router.include_router(items_router)
 root_router.include_router(users_list_router)
 root_router.include_router(exchange_router)
+root_router.include_router(transfers_router)
 
 app.include_router(root_router)
+# Router prefixes are not applied to WebSocket routes, so the events router gets its prefix here
+app.include_router(events_router, prefix=root_router.prefix)
+app.include_router(metrics_router)
+
+if get_settings().DEBUG:
+    app.add_middleware(ServerTimingMiddleware)
+if get_settings().METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if get_settings().PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        key=get_settings().SECRET_KEY,
+        directory=get_settings().PROFILING_DIR,
+        interval=get_settings().PROFILING_INTERVAL,
+    )
+
+
+@app.exception_handler(HashPoolBusy)
+async def hash_pool_busy_handler(request: Request, exc: HashPoolBusy):
+    """Fail fast while the password hashing queue is full."""
+    return JSONResponse(status_code=503, content={"detail": exc.args[0]}, headers={"Retry-After": "1"})
+
+
+async def load_memory_database():
+    """An in-memory database starts empty: create the tables and the initial load."""
+    if is_memory_url(get_settings().DATABASE_URL):
+        await create_database()
+
+
+app.add_event_handler("startup", load_memory_database)
+if get_settings().STATELESS_TOKENS:
+    app.add_event_handler("startup", load_token_generations)
+app.add_event_handler("startup", bus.start)
+app.add_event_handler("shutdown", bus.stop)
+app.add_event_handler("startup", sweeper.start)
+app.add_event_handler("shutdown", sweeper.stop)
+app.add_event_handler("shutdown", hash_pool.shutdown)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, log_level="debug", use_colors=True)
@@ -0,0 +1,83 @@
+"""In-process caches and HTTP cache validation."""
+import time
+from collections import OrderedDict
+
+__all__ = ["TTLCache", "caches", "etag_matches"]
+
+_missing = object()
+
+caches = {}
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire `ttl` seconds after being stored.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+
+    `version` moves on with every `pop` and `clear`. A value looked up elsewhere is stored with
+    the version read before the lookup, and dropped if anything was invalidated meanwhile:
+    the lookup may have read what was just invalidated.
+
+    :param name: label of the cache's metrics; unnamed caches are not exported
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, timer=time.monotonic, name: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._data = OrderedDict()
+        if name is not None:
+            caches[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return a fresh value for key and mark it as recently used."""
+        entry = self._data.get(key, _missing)
+        if entry is not _missing:
+            expires, value = entry
+            if expires > self.timer():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, version: int = None):
+        """Store value, evicting the least recently used entries beyond maxsize.
+
+        :param version: `version` read before value was looked up; stale values are not stored
+        """
+        if self.maxsize <= 0 or (version is not None and version != self.version):
+            return
+        self._data[key] = (self.timer() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Drop key from the cache."""
+        self.version += 1
+        entry = self._data.pop(key, _missing)
+        return default if entry is _missing else entry[1]
+
+    def clear(self):
+        self.version += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether the If-None-Match header lists the ETag; weak validators match too."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
@@ -0,0 +1,120 @@
+"""Push of item events to the connected clients of their users.
+
+Views call `emit` with the session of their change: the event is delivered once
+the transaction commits, and dropped if it rolls back. It reaches the
+subscriptions of this worker through `hub` and those of the other workers
+through the invalidation bus, which carries it in the same transaction.
+
+A subscription is a bounded queue, so an idle connection costs a queue and a
+waiting coroutine. A client too slow to drain its queue is told to resync
+instead of stalling the others.
+"""
+import asyncio
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from services.invalidation import bus
+from services.metrics import Gauge, registry
+
+__all__ = ["EventHub", "OVERFLOW", "Subscription", "emit", "hub", "item_event"]
+
+CHANNEL = "events"
+OVERFLOW = {"type": "overflow"}
+
+
+class Subscription:
+    """Events for one connection of a user."""
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, item: dict):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float):
+        """Next event, OVERFLOW once events were dropped, or None after `timeout` seconds without any."""
+        if self.overflowed:
+            return OVERFLOW
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """Subscriptions of this worker by user.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.published = 0
+        self._subscriptions = {}
+
+    def __len__(self):
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id: int, item: dict):
+        """Queue an event for every connection of the user."""
+        self.published += 1
+        for subscription in self._subscriptions.get(user_id, ()):
+            subscription.put(item)
+
+    def receive(self, key: str):
+        """Publish an event emitted by another worker."""
+        message = orjson.loads(key)
+        for user_id in message["users"]:
+            self.publish(user_id, message["event"])
+
+
+hub = EventHub(get_settings().EVENTS_QUEUE_SIZE)
+bus.subscribe(CHANNEL, hub.receive)
+registry.register(Gauge("events_connections", "Clients connected to the event stream.", function=lambda: len(hub)))
+
+
+def item_event(type_: str, items: list = None, count: int = None, **fields) -> dict:
+    """Event about items; beyond EVENTS_MAX_ITEMS, or when unknown, the items are left out (null)."""
+    if count is None:
+        count = len(items)
+    if items is not None and len(items) > get_settings().EVENTS_MAX_ITEMS:
+        items = None
+    return dict(type=type_, count=count, items=items, **fields)
+
+
+def emit(session, user_ids, item: dict):
+    """Deliver the event to the users once the session commits."""
+    users = sorted(set(user_ids))
+    bus.publish(session, CHANNEL, orjson.dumps({"users": users, "event": item}).decode())
+    session.sync_session.info.setdefault("events", []).append((users, item))
+
+
+@event.listens_for(Session, "after_commit")
+def deliver_events(session):
+    for users, item in session.info.pop("events", ()):
+        for user_id in users:
+            hub.publish(user_id, item)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_events(session):
+    session.info.pop("events", None)
@@ -0,0 +1,116 @@
+"""Password hashing offloaded from the event loop.
+
+bcrypt is deliberately slow, so hashing and verification run on a bounded
+thread or process pool. When the pool and its queue are full new jobs are
+rejected at once instead of piling up behind a login storm.
+"""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from config import get_settings
+
+__all__ = ["HashPool", "HashPoolBusy", "hash_pool", "pwd_context"]
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashPoolBusy(Exception):
+    """Hashing queue is full."""
+
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class HashPool:
+    """Run password hashing on a bounded executor.
+
+    :param workers: number of threads or processes
+    :param queue_size: jobs allowed to wait for a free worker
+    :param kind: "thread" or "process"
+
+    `duration`, a histogram set by `services.metrics`, observes the latency of every job.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 64, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hash pool kind: {kind}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.kind = kind
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.duration = None
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            executor_class = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker."""
+        return max(0, self.pending - self.workers)
+
+    async def run(self, fn, *args):
+        """Run fn on the pool or raise HashPoolBusy when the queue is full."""
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HashPoolBusy("Too many password operations in progress")
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.pending -= 1
+            self.completed += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            if self.duration is not None:
+                self.duration.observe(elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self.run(_verify, password, hashed)
+
+    def stats(self) -> dict:
+        """Queue depth and latency counters; latency includes time spent in the queue."""
+        return {
+            "workers": self.workers,
+            "in_flight": min(self.pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_avg": self.latency_total / self.completed if self.completed else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+hash_pool = HashPool(
+    workers=get_settings().HASH_POOL_WORKERS,
+    queue_size=get_settings().HASH_POOL_QUEUE_SIZE,
+    kind=get_settings().HASH_POOL_KIND,
+)
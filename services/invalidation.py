@@ -0,0 +1,148 @@
+"""Cache invalidation across the worker processes of one host.
+
+Every worker keeps in-process caches (principals, token generations, the users
+list) that go stale when another worker serves a write. Writers publish an event
+to the `cache_event` table in the transaction of their change, and every worker
+polls the table for the events past the last id it has seen: a primary key range
+scan, next to free when nothing has happened. Each event is handed to the
+handlers subscribed to its channel in every worker but the one that published
+it, which has already invalidated its own caches.
+
+SQLite serializes write transactions, so event ids are committed in increasing
+order and a poll never skips one. Events older than the retention period are
+pruned by every worker from time to time.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import delete, func, select
+
+from config import get_settings
+from database.engine import async_read_session, async_session
+from database.models import CacheEvent
+
+__all__ = ["InvalidationBus", "bus"]
+
+PRUNE_INTERVAL = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Cache invalidation events shared by the workers through the database.
+
+    :param session_factory: writer sessions, used to prune old events
+    :param read_session_factory: reader sessions, used to poll
+    :param interval: seconds between polls
+    :param retention: seconds events are kept for
+    """
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        read_session_factory=async_read_session,
+        interval: float = 0.5,
+        retention: float = 3600.0,
+        enabled: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.interval = interval
+        self.retention = retention
+        self.enabled = enabled
+        self.origin = f"{socket.gethostname()[:40]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self.last_id = None
+        self.received = 0
+        self._task = None
+
+    def subscribe(self, channel: str, handler):
+        """Call `handler(key)` for every event of the channel published by another worker."""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, session, channel: str, key: str = ""):
+        """Add an event to the transaction of the session; other workers see it once committed."""
+        if self.enabled:
+            session.add(CacheEvent(channel, key, self.origin, time.time()))
+
+    async def poll(self) -> int:
+        """Dispatch the events committed since the previous poll.
+
+        The first poll only records the latest event id: a starting worker has nothing cached.
+
+        :return number of events read
+        """
+        async with self.read_session_factory() as session:
+            if self.last_id is None:
+                result = await session.execute(select(func.max(CacheEvent.id)))
+                self.last_id = result.scalar() or 0
+                return 0
+            query = (
+                select(CacheEvent.id, CacheEvent.channel, CacheEvent.key, CacheEvent.origin)
+                .where(CacheEvent.id > self.last_id)
+                .order_by(CacheEvent.id)
+            )
+            rows = (await session.execute(query)).all()
+
+        for id_, channel, key, origin in rows:
+            self.last_id = id_
+            if origin == self.origin:
+                continue
+            self.received += 1
+            for handler in self.handlers.get(channel, ()):
+                try:
+                    handler(key)
+                except Exception:
+                    logger.exception("Cache invalidation handler failed on %s event %r", channel, key)
+        return len(rows)
+
+    async def prune(self) -> int:
+        """Delete the events older than the retention period; return their number."""
+        async with self.session_factory() as session:
+            result = await session.execute(delete(CacheEvent).where(CacheEvent.created < time.time() - self.retention))
+            await session.commit()
+        return result.rowcount
+
+    async def run(self):
+        """Poll until cancelled, pruning every PRUNE_INTERVAL seconds."""
+        pruned = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+                if time.monotonic() - pruned >= PRUNE_INTERVAL:
+                    pruned = time.monotonic()
+                    await self.prune()
+            except Exception:
+                logger.exception("Cache invalidation poll failed")
+
+    async def start(self):
+        """Skip the past events and start polling in the background."""
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            await self.poll()
+        except Exception:
+            logger.exception("Cache invalidation bus can't read events; is the database migrated?")
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+bus = InvalidationBus(
+    interval=get_settings().INVALIDATION_POLL_INTERVAL,
+    retention=get_settings().INVALIDATION_RETENTION,
+    enabled=get_settings().INVALIDATION_ENABLED,
+)
@@ -0,0 +1,398 @@
+"""Prometheus-style metrics kept in process and rendered in the text exposition format.
+
+`MetricsMiddleware` counts requests and observes their latency per route
+template, so `/api/v1/items/:{item_id}` is one series whatever the id.
+Engines created by `database.engine` report every query through SQLAlchemy
+events; the queries of a request are summed up in `QueryStats` found in the
+`current_queries` context variable while the request is served.
+
+Statements slower than the engine's threshold are logged with their
+parameters and route; parameters of statements that may carry tokens or
+password hashes are logged as types and lengths only. `ServerTimingMiddleware` reports the totals of every
+request in a Server-Timing header.
+"""
+import contextvars
+import logging
+import re
+import time
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+from services.cache import caches
+from services.hashing import hash_pool
+from services.singleflight import groups as singleflight_groups
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsMiddleware",
+    "QueryStats",
+    "Registry",
+    "ServerTimingMiddleware",
+    "current_queries",
+    "instrument_engine",
+    "registry",
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED = "unmatched"
+SLOW_QUERY_PARAMETERS_LENGTH = 500
+# Statements reading or writing tokens, and writes of users (password hashes)
+SENSITIVE_STATEMENT = re.compile(r"\buser_token\b|^\s*(INSERT INTO|UPDATE)\s+\"?user\b", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Named metric with a sample per combination of label values.
+
+    With `function` the samples are read from it at render time: a single value,
+    or a dict of label values to values.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.values = {}
+
+    def samples(self):
+        """Yield (name suffix, labels text, value)."""
+        values = self.values
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                yield "", "", values
+                return
+        for labels, value in sorted(values.items()):
+            yield "", _format_labels(self.labelnames, labels), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: tuple = (), value: float = 0):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, labels: tuple = ()):
+        """Count value in the first bucket it fits; buckets are made cumulative when rendered."""
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    def samples(self):
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield "_bucket", _format_labels(self.labelnames, labels, le), cumulative
+            yield "_sum", _format_labels(self.labelnames, labels), series["sum"]
+            yield "_count", _format_labels(self.labelnames, labels), series["count"]
+
+
+class Registry:
+    """Set of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.register(
+    Counter("http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+)
+request_duration = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+)
+requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests being served.", ("method", "route"))
+)
+queries_total = registry.register(Counter("db_queries_total", "Database queries executed."))
+request_queries = registry.register(
+    Histogram("db_queries_per_request", "Database queries per HTTP request.", ("route",), QUERY_COUNT_BUCKETS)
+)
+request_query_duration = registry.register(
+    Histogram("db_query_duration_seconds", "Time spent in database queries per HTTP request.", ("route",))
+)
+registry.register(
+    Gauge(
+        "hash_pool_queue_depth", "Password hashing jobs waiting for a worker.", function=lambda: hash_pool.queue_depth
+    )
+)
+registry.register(
+    Gauge(
+        "hash_pool_in_flight",
+        "Password hashing jobs running.",
+        function=lambda: min(hash_pool.pending, hash_pool.workers),
+    )
+)
+hash_pool.duration = registry.register(
+    Histogram("hash_pool_duration_seconds", "Password hashing job latency, time in the queue included.")
+)
+registry.register(
+    Counter("hash_pool_completed_total", "Password hashing jobs done.", function=lambda: hash_pool.completed)
+)
+registry.register(
+    Counter("hash_pool_rejected_total", "Password hashing jobs rejected.", function=lambda: hash_pool.rejected)
+)
+registry.register(
+    Counter(
+        "singleflight_calls_total",
+        "Lookups run by single-flight groups.",
+        ("group",),
+        function=lambda: {(name,): group.calls for name, group in singleflight_groups.items()},
+    )
+)
+registry.register(
+    Counter(
+        "singleflight_saved_total",
+        "Lookups that joined a call in flight instead of querying the database.",
+        ("group",),
+        function=lambda: {(name,): group.saved for name, group in singleflight_groups.items()},
+    )
+)
+registry.register(
+    Counter(
+        "cache_hits_total",
+        "Lookups answered by an in-process cache.",
+        ("cache",),
+        function=lambda: {(name,): cache.hits for name, cache in caches.items()},
+    )
+)
+registry.register(
+    Counter(
+        "cache_misses_total",
+        "Lookups an in-process cache could not answer.",
+        ("cache",),
+        function=lambda: {(name,): cache.misses for name, cache in caches.items()},
+    )
+)
+registry.register(
+    Gauge(
+        "cache_entries",
+        "Entries held by an in-process cache.",
+        ("cache",),
+        function=lambda: {(name,): len(cache) for name, cache in caches.items()},
+    )
+)
+
+
+class QueryStats:
+    """Database queries issued while serving one request."""
+
+    def __init__(self, route: str = None):
+        self.route = route
+        self.count = 0
+        self.duration = 0.0
+
+
+current_queries = contextvars.ContextVar("current_queries", default=None)
+
+
+def instrument_engine(engine, slow_query_threshold: float = None):
+    """Count and time every query of the engine.
+
+    :param slow_query_threshold: seconds from which a statement is logged as slow
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info["query_started"].pop()
+        queries_total.inc()
+        stats = current_queries.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += elapsed
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            logger.warning(
+                "Slow query (%.1f ms) on %s: %s; parameters: %.*s",
+                elapsed * 1000,
+                stats.route if stats is not None and stats.route else "-",
+                " ".join(statement.split()),
+                SLOW_QUERY_PARAMETERS_LENGTH,
+                repr(loggable_parameters(statement, parameters)),
+            )
+
+    return engine
+
+
+def loggable_parameters(statement: str, parameters):
+    """Parameters as they may be logged: redacted to types and lengths for sensitive statements."""
+    if not SENSITIVE_STATEMENT.search(statement):
+        return parameters
+    return _redact(parameters)
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_redact(item) for item in value)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return f"<{type(value).__name__} len={len(value)}>" if hasattr(value, "__len__") else f"<{type(value).__name__}>"
+
+
+def route_template(scope) -> str:
+    """Path template of the route matching the request."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return UNMATCHED
+
+
+def request_stats(scope, route: str = None):
+    """Query stats of the request, set up unless an outer middleware has done it.
+
+    :return stats and the context variable token to reset, if it was set here
+    """
+    stats = current_queries.get()
+    if stats is not None:
+        return stats, None
+    stats = QueryStats(route or route_template(scope))
+    return stats, current_queries.set(stats)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (scope["method"], route_template(scope))
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats, token = request_stats(scope, labels[1])
+        requests_in_flight.inc(labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_duration.observe(time.perf_counter() - started, labels)
+            requests_in_flight.dec(labels)
+            requests_total.inc(labels + (str(status),))
+            request_queries.observe(stats.count, labels[1:])
+            request_query_duration.observe(stats.duration, labels[1:])
+            if token is not None:
+                current_queries.reset(token)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding the number and duration of the database queries of a request to its response.
+
+    Streamed responses only account for the queries made before their headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = request_stats(scope)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                timing = (
+                    f'db;dur={stats.duration * 1000:.3f};desc="{stats.count} queries", app;dur={elapsed * 1000:.3f}'
+                )
+                message = dict(
+                    message, headers=list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if token is not None:
+                current_queries.reset(token)
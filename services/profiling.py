@@ -0,0 +1,151 @@
+"""On-demand profiling of single requests.
+
+With PROFILING_ENABLED the app is wrapped in `ProfilingMiddleware`. A request
+carrying a valid `X-Profile-Token` header (see `create_profile_token`) is served
+while a background thread samples the stacks of every thread, so time spent in
+hashing workers shows up next to the event loop. The result is in the collapsed
+stack format read by flamegraph.pl and speedscope: one "frame;frame;frame count"
+line per distinct stack. It is written to PROFILING_DIR, or returned instead of
+the response when no directory is configured.
+
+Without the setting the middleware is not installed at all. Run
+
+    python -m services.profiling
+
+to get a token valid for an hour.
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import jwt
+from jwt import PyJWTError
+
+__all__ = ["ProfilingMiddleware", "StackSampler", "create_profile_token"]
+
+HEADER = b"x-profile-token"
+
+
+def create_profile_token(key: str, expires_delta: datetime.timedelta = datetime.timedelta(hours=1)) -> str:
+    """Token allowing its bearer to profile requests until it expires."""
+    return jwt.encode({"profile": True, "exp": datetime.datetime.utcnow() + expires_delta}, key)
+
+
+def is_profile_token(token: str, key: str) -> bool:
+    try:
+        return jwt.decode(token, key, algorithms=["HS256"]).get("profile") is True
+    except PyJWTError:
+        return False
+
+
+def collapse(frame) -> str:
+    """Frames from the outermost one down to `frame` joined with semicolons."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Count the stacks of all the other threads every `interval` seconds until stopped."""
+
+    def __init__(self, interval: float = 0.001):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        names = {}
+        while True:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id not in names:
+                    names[thread_id] = {t.ident: t.name for t in threading.enumerate()}.get(thread_id, str(thread_id))
+                self.stacks[f"{names[thread_id]};{collapse(frame)}"] += 1
+            self.samples += 1
+            if self._stopped.wait(self.interval):
+                break
+
+    def stop(self) -> str:
+        """Stop sampling and return the profile in the collapsed stack format."""
+        self._stopped.set()
+        self.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that carry a profile token.
+
+    One request is profiled at a time; others are served as usual meanwhile.
+    """
+
+    def __init__(self, app, key: str, directory: str = "", interval: float = 0.001):
+        self.app = app
+        self.key = key
+        self.directory = directory
+        self.interval = interval
+        self.busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.busy:
+            await self.app(scope, receive, send)
+            return
+        token = dict(scope["headers"]).get(HEADER)
+        if not token or not is_profile_token(token.decode(), self.key):
+            await self.app(scope, receive, send)
+            return
+
+        self.busy = True
+        messages = []
+
+        async def collect(message):
+            messages.append(message)
+
+        sampler = StackSampler(self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send if self.directory else collect)
+        finally:
+            profile = sampler.stop()
+            self.busy = False
+        elapsed = time.perf_counter() - started
+
+        if self.directory:
+            self.store(scope, profile)
+            return
+        status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+        body = profile.encode()
+        headers = [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-profile-status", str(status).encode()),
+            (b"x-profile-duration", f"{elapsed:.6f}".encode()),
+            (b"x-profile-samples", str(sampler.samples).encode()),
+        ]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def store(self, scope, profile: str) -> str:
+        """Write the profile to a file named after the time and the request."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = "-".join(part for part in scope["path"].split("/") if part) or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10 ** 9:09d}-{scope['method']}-{path}.folded"
+        filename = os.path.join(self.directory, name.replace(":", "").replace("{", "").replace("}", ""))
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(profile)
+        return filename
+
+
+if __name__ == "__main__":
+    from config import get_settings
+
+    print(create_profile_token(get_settings().SECRET_KEY))
@@ -0,0 +1,56 @@
+"""Coalescing of identical concurrent lookups.
+
+A burst of requests needing the same row (parallel requests with one bearer
+token, say) would each run the same query. Through `SingleFlight.do` the first
+of them runs it and the others await its result, so the database sees one
+query per key at a time. Nothing is kept once the call is done: caching is up
+to the caller.
+"""
+import asyncio
+
+__all__ = ["SingleFlight", "groups"]
+
+groups = {}
+
+
+class SingleFlight:
+    """Group of lookups sharing the calls in flight with the same key.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+
+    :param name: label of the group's metrics
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.saved = 0
+        self._flights = {}
+        groups[name] = self
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key, function, *args):
+        """Return `await function(*args)`, joining the call with the same key if one is in flight.
+
+        The call runs in its own task, so a cancelled caller doesn't cancel it for the others.
+        Exceptions are raised to every caller.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._flights[key] = asyncio.ensure_future(function(*args))
+            task.add_done_callback(lambda _: self._land(key, task))
+        else:
+            self.saved += 1
+        return await asyncio.shield(task)
+
+    def _land(self, key, task):
+        self._flights.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved even when every caller has been cancelled
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "saved": self.saved, "in_flight": len(self._flights)}
@@ -0,0 +1,53 @@
+"""Access token generations for stateless token verification.
+
+Every login issues a token whose generation is one more than the one it
+revokes. Knowing the current generation of a user is enough to tell whether
+a token is still valid, without looking up the token in the database.
+"""
+
+from services.cache import caches
+
+__all__ = ["TokenGenerations"]
+
+
+class TokenGenerations:
+    """Current token generation of every known user.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+
+    :param name: label of the metrics, as for `TTLCache`
+    """
+
+    def __init__(self, name: str = None):
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}
+        if name is not None:
+            caches[name] = self
+
+    def __len__(self):
+        return len(self._generations)
+
+    def check(self, user_id: int, generation: int):
+        """Whether the token generation is the current one.
+
+        :return True or False, or None when the generation is unknown or newer:
+            it may come from a login this process hasn't seen yet
+        """
+        current = self._generations.get(user_id)
+        if current is None or generation > current:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return generation == current
+
+    def set(self, user_id: int, generation: int):
+        """Record a generation unless a newer one is already known."""
+        if generation > self._generations.get(user_id, 0):
+            self._generations[user_id] = generation
+
+    def clear(self):
+        self._generations.clear()
+
+    def stats(self) -> dict:
+        return {"users": len(self._generations), "hits": self.hits, "misses": self.misses}
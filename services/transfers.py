@@ -0,0 +1,77 @@
+"""Background purge of expired pending transfers.
+
+Expired offers can't be claimed any more (their links expire with them), they
+only take space in the achiever index. `TransferSweeper` deletes them a batch
+at a time, each batch in its own short write transaction, so requests waiting
+for the writer are never held up by one large DELETE.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy import delete, select
+
+from config import get_settings
+from database.engine import async_session
+from database.models import PendingTransfer
+
+__all__ = ["TransferSweeper", "purge_expired_transfers", "sweeper"]
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_expired_transfers(session_factory=async_session, batch_size: int = 1000, now: float = None) -> int:
+    """Delete the transfers expired by `now`, `batch_size` rows per transaction.
+
+    :return number of deleted rows
+    """
+    now = time.time() if now is None else now
+    expired = select(PendingTransfer.id).where(PendingTransfer.expires <= now).limit(batch_size)
+    query = delete(PendingTransfer).where(PendingTransfer.id.in_(expired)).execution_options(synchronize_session=False)
+    deleted = 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(query)
+            await session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+        await asyncio.sleep(0)
+
+
+class TransferSweeper:
+    """Purge expired transfers every `interval` seconds."""
+
+    def __init__(self, session_factory=async_session, interval: float = 300.0, batch_size: int = 1000):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.deleted = 0
+        self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                self.deleted += await purge_expired_transfers(self.session_factory, self.batch_size)
+            except Exception:
+                logger.exception("Purging expired transfers failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+sweeper = TransferSweeper(
+    interval=get_settings().TRANSFER_SWEEP_INTERVAL, batch_size=get_settings().TRANSFER_SWEEP_BATCH
+)
@@ -2,17 +2,31 @@
 import asyncio
 import json
 import os
-from unittest.mock import patch
+import uuid
+
+# Every pytest worker process gets its own in-memory databases, the app's default one included
+worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+os.environ["DATABASE_URL"] = f"sqlite:///file:owm-{worker}?mode=memory&cache=shared&uri=true"
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
+from config import get_settings
+from database.engine import (
+    create_read_engine,
+    create_write_engine,
+    get_read_session,
+    get_session,
+    keep_alive,
+    memory_database_url,
+)
 from database.models import main
 from main import app
+from validators.authentication import principal_cache, token_generations
+from views.users_list import users_cache
 
-basedir = os.path.abspath(os.path.dirname(__file__))
-db_filename = os.path.join(basedir, "test.db")
 scope = "class"
 
 
@@ -23,45 +37,98 @@ def test_client():
 
 
 @pytest.fixture(scope=scope)
-def engine():
-    """DB engine."""
-    return create_async_engine("sqlite:///" + db_filename)
+def database_url():
+    """URL of an in-memory database, dropped when the fixture is finalized."""
+    url = memory_database_url(f"owm-test-{worker}-{uuid.uuid4().hex}")
+    anchor = keep_alive(url)
+    yield url
+    anchor.close()
+
+
+def create_engine(factory, url):
+    """Build an engine with a running loop: asyncio pools need one at creation time."""
+
+    async def create():
+        return factory(url, get_settings())
+
+    return asyncio.run(create())
+
+
+@pytest.fixture(scope=scope)
+def engine(database_url):
+    """DB writer engine."""
+    engine = create_engine(create_write_engine, database_url)
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture(scope=scope)
+def read_engine(database_url):
+    """DB read-only engine."""
+    engine = create_engine(create_read_engine, database_url)
+    yield engine
+    asyncio.run(engine.dispose())
 
 
 @pytest.fixture(scope=scope)
 def session(engine):
-    """DB session."""
-    return AsyncSession(engine)
+    """DB session factory."""
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
 @pytest.fixture(scope=scope)
-def test_session(engine, session):
-    """Create test database and yield its session."""
-    with patch("database.models.engine", engine):
-        with patch("database.models.session", session) as session:
-            asyncio.run(main(test=True))
-            yield session
-            os.remove(db_filename)
+def test_session(engine, read_engine, session):
+    """Create test database and route every request session to it."""
+    read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_test_session():
+        async with session() as test_session:
+            yield test_session
+
+    async def get_test_read_session():
+        async with read_session() as test_session:
+            yield test_session
+
+    asyncio.run(main(test=True, bind=engine))
+    app.dependency_overrides[get_session] = get_test_session
+    app.dependency_overrides[get_read_session] = get_test_read_session
+    principal_cache.clear()
+    token_generations.clear()
+    users_cache.invalidate()
+    yield session
+    del app.dependency_overrides[get_session]
+    del app.dependency_overrides[get_read_session]
+    asyncio.run(engine.dispose())
+    asyncio.run(read_engine.dispose())
+
+
+@pytest.fixture()
+async def event_loop_pools(engine, read_engine):
+    """Renew the connection pools inside the loop of an async test.
+
+    Pools wait for connections on asyncio queues bound to the loop they were first used in.
+    """
+    await engine.dispose()
+    await read_engine.dispose()
+    yield
+    await engine.dispose()
+    await read_engine.dispose()
 
 
 @pytest.fixture(scope=scope)
 def token(test_client, test_session):
     """Get test user login token."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.login.session", test_session):
-            payload = {"username": "testuser1", "password": "Qwerty123_"}
-            response = test_client.post("api/v1/login", data=payload).json()
-            return response["access_token"]
+    payload = {"username": "testuser1", "password": "Qwerty123_"}
+    response = test_client.post("api/v1/login", data=payload).json()
+    return response["access_token"]
 
 
 @pytest.fixture(scope=scope)
 def exchange_link(test_client, test_session, token):
     """Create an exchange link to move item 1-1 from testuser1 to testuser2."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.items.session", test_session):
-            headers = {"Authorization": f"Bearer {token}"}
-            transfer_data = {"item_id": 1, "achiever": "testuser2"}
-            payload = json.dumps(transfer_data)
-            response = test_client.post("/api/v1/send", headers=headers, data=payload)
-            yield response.json()["link"]
-            del response.json()["link"]
+    headers = {"Authorization": f"Bearer {token}"}
+    transfer_data = {"item_id": 1, "achiever": "testuser2"}
+    payload = json.dumps(transfer_data)
+    response = test_client.post("/api/v1/send", headers=headers, data=payload)
+    yield response.json()["link"]
+    del response.json()["link"]
@@ -0,0 +1,179 @@
+"""Test access token authentication."""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.client import ASGIClient
+from config import Settings, get_settings
+from main import app
+from services.cache import TTLCache
+from services.tokens import TokenGenerations
+from validators import authentication
+from validators.authentication import load_token_generations, principal_cache, token_digest, token_generations
+
+
+def test_principal_is_cached(test_client, test_session, token):
+    """Test repeated requests with one token are served from the principal cache."""
+    headers = {"Authorization": f"Bearer {token}"}
+    test_client.get("/api/v1/items", headers=headers)
+    hits = principal_cache.hits
+    response = test_client.get("/api/v1/items", headers=headers)
+    assert response.status_code == 200
+    assert principal_cache.hits == hits + 1
+    assert principal_cache.get(token_digest(token)).username == "testuser1"
+
+
+def test_login_invalidates_cached_principal(test_client, test_session, token):
+    """Test a new login evicts the revoked token from the cache."""
+    headers = {"Authorization": f"Bearer {token}"}
+    test_client.get("/api/v1/items", headers=headers)
+    assert principal_cache.get(token_digest(token))
+
+    payload = {"username": "testuser1", "password": "Qwerty123_"}
+    test_client.post("api/v1/login", data=payload)
+    assert principal_cache.get(token_digest(token)) is None
+
+
+@pytest.mark.asyncio
+async def test_lookup_racing_a_login_does_not_cache_the_revoked_token(test_session, token, event_loop_pools):
+    """Test a principal read before a login commits is not cached once the login has revoked its token."""
+    client = ASGIClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+    looked_up, resume = asyncio.Event(), asyncio.Event()
+    find_principal = authentication.find_principal
+
+    async def slow_find_principal(*args):
+        row = await find_principal(*args)
+        looked_up.set()
+        await resume.wait()
+        return row
+
+    principal_cache.clear()
+    with patch("validators.authentication.find_principal", slow_find_principal):
+        request = asyncio.ensure_future(client.get("/api/v1/items/", headers=headers))
+        await looked_up.wait()
+        form = {"username": "testuser1", "password": "Qwerty123_"}
+        assert (await client.post("/api/v1/login", form=form)).status_code == 200
+        resume.set()
+        assert (await request).status_code == 200
+
+    assert principal_cache.get(token_digest(token)) is None
+    assert (await client.get("/api/v1/items/", headers=headers)).status_code == 401
+
+
+def test_ttl_cache_skips_values_read_before_an_invalidation():
+    """Test a value looked up before a pop or clear is not stored."""
+    cache = TTLCache(maxsize=10, ttl=60)
+    version = cache.version
+    cache.pop("key")
+    cache.set("key", "stale", version)
+    assert cache.get("key") is None
+    version = cache.version
+    cache.set("key", "fresh", version)
+    assert cache.get("key") == "fresh"
+
+
+def test_ttl_cache_expiry():
+    """Test cache entries expire after ttl."""
+    now = [0.0]
+    cache = TTLCache(maxsize=10, ttl=5, timer=lambda: now[0])
+    cache.set("key", "value")
+    now[0] = 4.9
+    assert cache.get("key") == "value"
+    now[0] = 5.0
+    assert cache.get("key") is None
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 0)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test the cache never grows beyond maxsize."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_token_generations():
+    """Test only the current generation is valid and newer ones are unknown."""
+    generations = TokenGenerations()
+    assert generations.check(1, 1) is None
+    generations.set(1, 2)
+    generations.set(1, 1)
+    assert generations.check(1, 2) is True
+    assert generations.check(1, 1) is False
+    assert generations.check(1, 3) is None
+    assert generations.stats() == {"users": 1, "hits": 2, "misses": 2}
+
+
+class TestStatelessTokens:
+    @pytest.fixture(scope="class")
+    def stateless(self, test_session):
+        app.dependency_overrides[get_settings] = lambda: Settings(STATELESS_TOKENS=True)
+        yield
+        del app.dependency_overrides[get_settings]
+
+    @pytest.fixture()
+    def queries(self, read_engine):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(read_engine.sync_engine, "before_cursor_execute", count)
+        yield statements
+        event.remove(read_engine.sync_engine, "before_cursor_execute", count)
+
+    @staticmethod
+    def login(test_client) -> dict:
+        response = test_client.post("api/v1/login", data={"username": "testuser1", "password": "Qwerty123_"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_current_generation_needs_no_lookup(self, test_client, stateless, queries):
+        """Test a token of the current generation is accepted without reading tokens."""
+        headers = self.login(test_client)
+        principal_cache.clear()
+        response = test_client.get("/api/v1/items/", headers=headers)
+        assert response.status_code == 200 and "testuser1" in response.json()
+        assert not [statement for statement in queries if "user_token" in statement]
+
+    def test_older_generation_is_rejected_without_lookup(self, test_client, stateless, queries):
+        """Test a new login revokes the previous token in memory."""
+        old_headers = self.login(test_client)
+        new_headers = self.login(test_client)
+        assert test_client.get("/api/v1/items/", headers=old_headers).status_code == 401
+        assert test_client.get("/api/v1/items/", headers=new_headers).status_code == 200
+        assert not [statement for statement in queries if "user_token" in statement]
+
+    def test_unknown_generation_falls_back_to_stored_token(self, test_client, stateless, queries):
+        """Test a generation unknown to this process is looked up once, then trusted."""
+        headers = self.login(test_client)
+        token_generations.clear()
+        principal_cache.clear()
+        assert test_client.get("/api/v1/items/", headers=headers).status_code == 200
+        assert len([statement for statement in queries if "user_token" in statement]) == 1
+        principal_cache.clear()
+        assert test_client.get("/api/v1/items/", headers=headers).status_code == 200
+        assert len([statement for statement in queries if "user_token" in statement]) == 1
+
+    def test_generations_are_loaded_from_stored_tokens(self, test_client, read_engine, stateless):
+        """Test startup fills the generations of users who have logged in."""
+        self.login(test_client)
+        self.login(test_client)
+        token_generations.clear()
+        read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+        with patch("validators.authentication.async_read_session", read_session):
+            asyncio.run(load_token_generations())
+        assert len(token_generations) == 1
+        assert token_generations.check(1, 1) is False
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,44 @@
+"""Test the route benchmark suite."""
+import pytest
+
+from benchmarks.routes import percentile, regressions, run
+
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) == 0.0
+
+
+def test_regressions():
+    """Test slower p95 and lower throughput are reported past the tolerance only."""
+    baseline = {"routes": {"GET /users": {"p95_ms": 10.0, "rps": 100.0}}}
+    report = {"routes": {"GET /users": {"p95_ms": 11.0, "rps": 90.0}, "GET /get": {"p95_ms": 1.0, "rps": 1.0}}}
+    assert regressions(report, baseline, tolerance=0.2) == []
+    report["routes"]["GET /users"] = {"p95_ms": 13.0, "rps": 70.0}
+    assert len(regressions(report, baseline, tolerance=0.2)) == 2
+
+
+@pytest.mark.asyncio
+async def test_scenario_reports_every_route():
+    """Test a small in-process run covers every route without failures."""
+    report = await run("asgi", users=2, items=1, concurrency=2)
+    routes = report["routes"]
+    assert set(routes) == {
+        "POST /registration",
+        "POST /login",
+        "POST /items/new",
+        "GET /items/",
+        "GET /users",
+        "POST /send",
+        "GET /get",
+    }
+    assert all(route["failures"] == 0 and route["requests"] > 0 for route in routes.values())
+    assert all(route["p50_ms"] <= route["p95_ms"] <= route["p99_ms"] for route in routes.values())
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,103 @@
+"""Test per-request database sessions."""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.client import ASGIClient
+from config import get_settings
+from database.engine import (
+    create_read_engine,
+    create_write_engine,
+    get_session,
+    is_memory_url,
+    keep_alive,
+    memory_database_url,
+)
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_every_request_gets_its_own_session():
+    """Test the session dependency never hands out a shared session."""
+    first, second = get_session(), get_session()
+    session1, session2 = await first.__anext__(), await second.__anext__()
+    assert session1 is not session2
+    for generator in (first, second):
+        with pytest.raises(StopAsyncIteration):
+            await generator.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests(test_session, token, event_loop_pools):
+    """Test many concurrent authenticated requests are all served."""
+    client = ASGIClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+    responses = await asyncio.gather(
+        *(client.get("/api/v1/items/" if i % 2 else "/api/v1/users", headers=headers) for i in range(100))
+    )
+    assert {response.status_code for response in responses} == {200}
+
+
+def pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+@pytest.mark.asyncio
+async def test_file_database_uses_wal(tmp_path):
+    """Test file databases are switched to WAL journaling."""
+    engine = create_write_engine("sqlite:///" + str(tmp_path / "wal.db"), get_settings())
+    async with engine.connect() as connection:
+        assert await connection.run_sync(pragma, "journal_mode") == "wal"
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_only_memory_database_readers_read_uncommitted(tmp_path):
+    """Test readers of a file database keep to committed data, unlike those sharing the memory cache."""
+    url = memory_database_url("owm-test-read-uncommitted")
+    anchor = keep_alive(url)
+    for url, expected in (("sqlite:///" + str(tmp_path / "readers.db"), 0), (url, 1)):
+        engine = create_read_engine(url, get_settings())
+        async with engine.connect() as connection:
+            assert await connection.run_sync(pragma, "read_uncommitted") == expected
+            assert await connection.run_sync(pragma, "query_only") == 1
+        await engine.dispose()
+    anchor.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_database_lives_while_kept_alive():
+    """Test an in-memory database is shared by engines until its keep-alive connection closes."""
+    url = memory_database_url("owm-test-keep-alive")
+    assert is_memory_url(url) and not is_memory_url("sqlite:///prod.db")
+    anchor = keep_alive(url)
+    writer, reader = create_write_engine(url, get_settings()), create_write_engine(url, get_settings())
+    async with writer.begin() as connection:
+        await connection.run_sync(lambda sync: sync.execute(text("CREATE TABLE kept (id INTEGER)")))
+    await writer.dispose()
+    async with reader.connect() as connection:
+        assert await connection.run_sync(lambda sync: sync.execute(text("SELECT count(*) FROM kept")).scalar()) == 0
+    await reader.dispose()
+    anchor.close()
+    async with reader.connect() as connection:
+        with pytest.raises(OperationalError, match="no such table"):
+            await connection.run_sync(lambda sync: sync.execute(text("SELECT count(*) FROM kept")))
+    await reader.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile(test_session, engine, read_engine, event_loop_pools):
+    """Test connections are tuned and the read pool refuses writes."""
+    async with engine.connect() as connection:
+        assert await connection.run_sync(pragma, "cache_size") == get_settings().SQLITE_CACHE_SIZE
+        assert await connection.run_sync(pragma, "query_only") == 0
+    async with read_engine.connect() as connection:
+        assert await connection.run_sync(pragma, "query_only") == 1
+        with pytest.raises(OperationalError, match="readonly"):
+            await connection.run_sync(lambda sync: sync.execute(text("DELETE FROM item")))
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,214 @@
+"""Test item events pushed to clients."""
+import asyncio
+import json
+
+import orjson
+import pytest
+
+from benchmarks.client import ASGIClient, encode_request
+from config import Settings, get_settings
+from main import app
+from services.events import OVERFLOW, EventHub, emit, hub, item_event
+from views.events import server_sent_events
+
+
+@pytest.fixture()
+def fast_heartbeat():
+    app.dependency_overrides[get_settings] = lambda: Settings(EVENTS_HEARTBEAT=0.05)
+    yield
+    del app.dependency_overrides[get_settings]
+
+
+async def wait_for_connections(count: int):
+    """Let the connections open or close: a closed stream unsubscribes once its task is cancelled."""
+    for _ in range(200):
+        if len(hub) == count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{len(hub)} connections instead of {count}")
+
+
+def scope_for(type_: str, path: str, headers: dict, query: str = "") -> dict:
+    _, raw_headers = encode_request(headers)
+    return {
+        "type": type_,
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http" if type_ == "http" else "ws",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": raw_headers + [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+        "subprotocols": [],
+    }
+
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_and_flags_slow_subscribers():
+    """Test events reach every connection of their user only, and a full queue overflows."""
+    events = EventHub(queue_size=2)
+    first, second, other = events.subscribe(1), events.subscribe(1), events.subscribe(2)
+    assert len(events) == 3
+
+    events.publish(1, {"type": "a"})
+    events.receive(orjson.dumps({"users": [1, 2], "event": {"type": "b"}}).decode())
+    assert first.queue.qsize() == second.queue.qsize() == 2 and other.queue.qsize() == 1
+
+    events.publish(1, {"type": "c"})
+    assert first.overflowed and await first.get(0.01) is OVERFLOW
+    assert await other.get(0.01) == {"type": "b"}
+    assert await other.get(0.01) is None
+
+    for subscription in (first, second, other):
+        events.unsubscribe(subscription)
+    assert len(events) == 0
+
+
+def test_item_event_leaves_out_long_item_lists():
+    """Test events list at most EVENTS_MAX_ITEMS items but always count them."""
+    items = [{"id": i} for i in range(get_settings().EVENTS_MAX_ITEMS + 1)]
+    assert item_event("item.created", items[:1]) == {"type": "item.created", "count": 1, "items": [{"id": 0}]}
+    assert item_event("item.created", items)["items"] is None
+    assert item_event("item.deleted", count=3) == {"type": "item.deleted", "count": 3, "items": None}
+
+
+def test_events_are_delivered_on_commit_only(test_session):
+    """Test an event of a rolled back transaction is dropped."""
+
+    async def scenario():
+        subscription = hub.subscribe(42)
+        try:
+            async with test_session() as session:
+                emit(session, [42], {"type": "rolled.back"})
+                await session.rollback()
+                emit(session, [42], {"type": "committed"})
+                await session.commit()
+            return [await subscription.get(0.01), await subscription.get(0.01)]
+        finally:
+            hub.unsubscribe(subscription)
+
+    assert asyncio.run(scenario()) == [{"type": "committed"}, None]
+
+
+@pytest.mark.asyncio
+async def test_server_sent_events_format():
+    """Test events are framed as SSE, idle streams get a heartbeat and the stream ends on overflow."""
+
+    async def not_disconnected():
+        return False
+
+    stream = server_sent_events(7, not_disconnected, 0.01)
+    assert len(hub) == 0
+    try:
+        assert await stream.__anext__() == b": ping\n\n"
+        hub.publish(7, {"type": "item.created", "count": 1})
+        assert await stream.__anext__() == b'event: item.created\ndata: {"type":"item.created","count":1}\n\n'
+        for _ in range(get_settings().EVENTS_QUEUE_SIZE + 1):
+            hub.publish(7, {"type": "item.deleted"})
+        assert await stream.__anext__() == b'event: overflow\ndata: {"type":"overflow"}\n\n'
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert len(hub) == 0
+    finally:
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_event_stream_pushes_created_items(test_session, token, fast_heartbeat, event_loop_pools):
+    """Test a connected client is told about an item created by another request."""
+    headers = {"Authorization": f"Bearer {token}"}
+    disconnected = asyncio.Event()
+    messages = []
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    stream = asyncio.ensure_future(app(scope_for("http", "/api/v1/events", headers), receive, send))
+    await wait_for_connections(1)
+    response = await ASGIClient(app).post("/api/v1/items/new", headers=headers, json_body={"title": "pushed_item"})
+    item_id = response.json()["item"]["id"]
+    for _ in range(100):
+        if any(b"item.created" in message.get("body", b"") for message in messages):
+            break
+        await asyncio.sleep(0.01)
+    disconnected.set()
+    await asyncio.wait_for(stream, 5)
+
+    assert messages[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in messages[0]["headers"]
+    body = b"".join(message.get("body", b"") for message in messages)
+    data = [line[6:] for line in body.split(b"\n") if line.startswith(b"data: ")]
+    assert json.loads(data[0]) == {
+        "type": "item.created",
+        "count": 1,
+        "items": [{"id": item_id, "title": "pushed_item"}],
+    }
+    await wait_for_connections(0)
+
+
+@pytest.mark.asyncio
+async def test_websocket_pushes_transfers(test_session, token, event_loop_pools):
+    """Test both sides of a transfer are told over WebSocket, authenticated by a query parameter."""
+    client = ASGIClient(app)
+    form = {"username": "testuser2", "password": "Qwerty123-"}
+    token2 = (await client.post("/api/v1/login", form=form)).json()["access_token"]
+    incoming = asyncio.Queue()
+    messages = []
+    await incoming.put({"type": "websocket.connect"})
+
+    async def send(message):
+        messages.append(message)
+
+    socket = asyncio.ensure_future(
+        app(scope_for("websocket", "/api/v1/events/ws", {}, f"token={token2}"), incoming.get, send)
+    )
+    await wait_for_connections(1)
+    headers = {"Authorization": f"Bearer {token}"}
+    item_id = (await client.post("/api/v1/items/new", headers=headers, json_body={"title": "ws_item"})).json()
+    item_id = item_id["item"]["id"]
+    link = await client.post("/api/v1/send", headers=headers, json_body={"item_id": item_id, "achiever": "testuser2"})
+    await client.get(link.json()["link"], headers={"Authorization": f"Bearer {token2}"})
+    for _ in range(100):
+        if len(messages) >= 3:
+            break
+        await asyncio.sleep(0.01)
+    await incoming.put({"type": "websocket.disconnect", "code": 1000})
+    await asyncio.wait_for(socket, 5)
+
+    assert messages[0] == {"type": "websocket.accept", "subprotocol": None}
+    events = [json.loads(message["text"]) for message in messages[1:]]
+    assert [event["type"] for event in events] == ["transfer.offered", "item.transferred"]
+    assert events[0]["sender"] == "testuser1" and events[0]["items"] == [{"id": item_id}]
+    assert events[1]["sender_id"] == 1 and events[1]["achiever_id"] == 2
+    await wait_for_connections(0)
+
+
+@pytest.mark.asyncio
+async def test_websocket_rejects_invalid_token(test_session, event_loop_pools):
+    """Test a connection without a valid token is closed before it is accepted."""
+    incoming = asyncio.Queue()
+    await incoming.put({"type": "websocket.connect"})
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope_for("websocket", "/api/v1/events/ws", {"Authorization": "Bearer invalid"}), incoming.get, send)
+    assert messages == [{"type": "websocket.close", "code": 1008}]
+
+
+def test_event_stream_unauthorized(test_client):
+    """Test the stream needs a token."""
+    assert test_client.get("/api/v1/events").status_code == 401
+
+
+if __name__ == "__main__":
+    pytest.main()
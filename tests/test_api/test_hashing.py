@@ -0,0 +1,71 @@
+"""Test password hashing pool."""
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from services.hashing import HashPool, HashPoolBusy
+from services.metrics import Histogram
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    """Test hashing round trip on the pool."""
+    pool = HashPool(workers=1, queue_size=1)
+    hashed = await pool.hash("Qwerty123_")
+    assert hashed != "Qwerty123_"
+    assert await pool.verify("Qwerty123_", hashed)
+    assert not await pool.verify("Qwerty123-", hashed)
+    assert pool.stats()["completed"] == 3
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_job_latency_is_observed():
+    """Test every job, even a failing one, is observed in the duration histogram."""
+    pool = HashPool(workers=1, queue_size=1)
+    pool.duration = Histogram("hash_seconds", "Hashing.")
+    await pool.hash("Qwerty123_")
+    with pytest.raises(ValueError):
+        await pool.verify("Qwerty123_", "not a hash")
+    assert pool.duration.values[()]["count"] == 2
+    assert pool.duration.values[()]["sum"] > 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected():
+    """Test jobs beyond workers + queue_size fail fast."""
+    pool = HashPool(workers=1, queue_size=1)
+    release = threading.Event()
+    jobs = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert pool.stats()["queue_depth"] == 1
+
+    with pytest.raises(HashPoolBusy):
+        await pool.run(release.wait)
+    assert pool.rejected == 1
+
+    release.set()
+    await asyncio.gather(*jobs)
+    assert pool.stats()["queue_depth"] == 0
+    pool.shutdown()
+
+
+def test_busy_pool_returns_503(test_client, test_session):
+    """Test login and registration answer 503 while the hashing queue is full."""
+    with patch("services.hashing.HashPool.run", side_effect=HashPoolBusy("busy")):
+        payload = {"username": "testuser1", "password": "Qwerty123_"}
+        response = test_client.post("api/v1/login", data=payload)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"]
+
+        payload = json.dumps({"username": "newtestuser", "password": "Qwerty123_"})
+        response = test_client.post("api/v1/registration", data=payload)
+        assert response.status_code == 503
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,107 @@
+"""Test cache invalidation across workers."""
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from database.models import CacheEvent
+from services.invalidation import InvalidationBus, bus
+from validators.authentication import principal_cache, token_digest, token_generations
+from views.users_list import users_cache
+
+
+@pytest.fixture()
+def worker(test_session, read_engine):
+    """Bus of another worker sharing the app's subscriptions."""
+    read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    other = InvalidationBus(test_session, read_session)
+    other.handlers = bus.handlers
+    asyncio.run(other.poll())
+    return other
+
+
+def test_events_reach_other_workers_only(test_session, read_engine):
+    """Test an event is dispatched by every bus but the publisher's."""
+    read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    publisher, subscriber = InvalidationBus(test_session, read_session), InvalidationBus(test_session, read_session)
+    received = {publisher: [], subscriber: []}
+    for each in received:
+        each.subscribe("test", received[each].append)
+
+    async def scenario():
+        await publisher.poll()
+        await subscriber.poll()
+        async with test_session() as session:
+            publisher.publish(session, "test", "a")
+            publisher.publish(session, "other", "b")
+            await session.commit()
+        return await publisher.poll(), await subscriber.poll(), await subscriber.poll()
+
+    assert asyncio.run(scenario()) == (2, 2, 0)
+    assert received == {publisher: [], subscriber: ["a"]}
+    assert subscriber.received == 2
+
+
+async def event_keys(test_session, channel: str) -> list:
+    async with test_session() as session:
+        return (await session.execute(select(CacheEvent.key).where(CacheEvent.channel == channel))).scalars().all()
+
+
+def test_login_on_another_worker_revokes_cached_token(test_client, test_session, worker, token):
+    """Test a login evicts the revoked token cached by another worker and sets its generation."""
+    user = principal_cache.get(token_digest(token)) or object()
+    response = test_client.post("api/v1/login", data={"username": "testuser1", "password": "Qwerty123_"})
+    assert response.status_code == 200
+    assert asyncio.run(event_keys(test_session, "token"))[-1] == f"1:2:{token_digest(token)}"
+    principal_cache.set(token_digest(token), user)
+    token_generations.clear()
+
+    assert asyncio.run(worker.poll()) == 1
+    assert principal_cache.get(token_digest(token)) is None
+    assert token_generations.check(1, 1) is False
+
+
+def test_registration_on_another_worker_invalidates_users_list(test_client, worker):
+    """Test a registration drops the users list cached by another worker."""
+    payload = {"username": "invalidation_user", "password": "Qwerty123_"}
+    assert test_client.post("/api/v1/registration", json=payload).status_code == 201
+    users_cache.set(b"[]", users_cache.version)
+    assert users_cache.get()
+
+    asyncio.run(worker.poll())
+    assert users_cache.get() is None
+
+
+def test_failed_registration_publishes_nothing(test_client, worker):
+    """Test the event is rolled back with the registration."""
+    payload = {"username": "testuser1", "password": "Qwerty123_"}
+    assert test_client.post("/api/v1/registration", json=payload).status_code == 400
+    assert asyncio.run(worker.poll()) == 0
+
+
+def test_prune_keeps_ids_growing(test_session, worker):
+    """Test old events are pruned and their ids are not reused."""
+
+    async def scenario():
+        async with test_session() as session:
+            await session.execute(
+                insert(CacheEvent), [{"channel": "test", "key": "", "origin": "gone", "created": time.time() - 7200}]
+            )
+            await session.commit()
+        pruned = await worker.prune()
+        async with test_session() as session:
+            session.add(CacheEvent("test", "", "gone", time.time()))
+            await session.commit()
+            ids = (await session.execute(select(CacheEvent.id).where(CacheEvent.origin == "gone"))).scalars().all()
+        return pruned, ids
+
+    pruned, ids = asyncio.run(scenario())
+    assert pruned == 1
+    assert ids == [worker.last_id + 2]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,40 +1,40 @@
 """Test items view."""
+import asyncio
 import json
-from unittest.mock import patch
+import re
 
 import pytest
+from sqlalchemy import event
 
+from benchmarks.client import ASGIClient
 from config import get_settings
+from main import app
+from views.items import generate_exchange_token, pack_ids, unpack_ids
 from views.login import create_access_token
 
 settings = get_settings()
 
 
-@pytest.fixture()
-def exchange_link2(test_client, test_session, token):
-    """Create an exchange link to move item 1-1 from testuser1 to testuser3."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.items.session", test_session):
-            headers = {"Authorization": f"Bearer {token}"}
-            transfer_data = {"item_id": 1, "achiever": "testuser3"}
-            payload = json.dumps(transfer_data)
-            response = test_client.post("/api/v1/send", headers=headers, data=payload)
-            yield response.json()["link"]
-            del response.json()["link"]
-
-
 class TestGetItems:
     """Test the work of users' items list get method."""
 
     @staticmethod
     def test_get_user_items(test_client, test_session, token):
         """Test items items view sends 200 & items."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get("/api/v1/items", headers=headers)
-                assert response.status_code == 200
-                assert response.json()["testuser1"]
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["testuser1"]
+
+    @staticmethod
+    def test_get_user_items_serialized_from_rows(test_client, test_session, token):
+        """Test a page is compact JSON matching the documented response model."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items/?limit=1", headers=headers)
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == b'{"testuser1":[{"id":1,"title":"item1-1"}],"next_cursor":1}'
+        schema = test_client.get("/openapi.json").json()["paths"]["/api/v1/items/"]["get"]
+        assert schema["responses"]["200"]["content"]["application/json"]["schema"]["$ref"].endswith("/ItemsPage")
 
     @staticmethod
     def test_get_user_items_unauthorized(test_client, exchange_link):
@@ -45,21 +45,97 @@ class TestGetItems:
     @staticmethod
     def test_get_users_items_invalid_token(test_client, test_session, token):
         """Test view sends 401 for invalid token."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.users_list.session", test_session):
-                headers = {"Authorization": f"Bearer {token}+a"}
-                response = test_client.get("/api/v1/items", headers=headers)
-                assert response.status_code == 401
+        headers = {"Authorization": f"Bearer {token}+a"}
+        response = test_client.get("/api/v1/items", headers=headers)
+        assert response.status_code == 401
+
+    @staticmethod
+    def test_get_user_items_by_pages(test_client, test_session, token):
+        """Test items are paged through with a keyset cursor."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items?limit=1", headers=headers).json()
+        assert [item["title"] for item in response["testuser1"]] == ["item1-1"]
+        assert response["next_cursor"] == 1
+
+        response = test_client.get(f"/api/v1/items?limit=1&after={response['next_cursor']}", headers=headers).json()
+        assert [item["title"] for item in response["testuser1"]] == ["item1-2"]
+        assert response["next_cursor"] is None
+
+    @staticmethod
+    @pytest.mark.parametrize("query", ["limit=0", "limit=1001", "after=-1", "limit=a"])
+    def test_get_user_items_bad_page(test_client, test_session, token, query):
+        """Test invalid pagination parameters are rejected."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get(f"/api/v1/items?{query}", headers=headers)
+        assert response.status_code == 422
+
+    @staticmethod
+    def test_stream_user_items(test_client, test_session, token):
+        """Test items are streamed as NDJSON on request."""
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/x-ndjson"}
+        response = test_client.get("/api/v1/items?after=1", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == [{"id": 2, "title": "item1-2"}]
+
+    @staticmethod
+    def test_unchanged_items_are_not_modified(test_client, read_engine, test_session, token):
+        """Test a poll with the current ETag gets 304 without reading the items."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items", headers=headers)
+        etag = response.headers["etag"]
+        ndjson = test_client.get("/api/v1/items", headers={**headers, "Accept": "application/x-ndjson"})
+        assert ndjson.headers["etag"] != etag
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(read_engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            for if_none_match in (etag, f'W/{etag}, "other"', "*"):
+                response = test_client.get("/api/v1/items", headers={**headers, "If-None-Match": if_none_match})
+                assert response.status_code == 304 and response.content == b""
+                assert response.headers["etag"] == etag
+        finally:
+            event.remove(read_engine.sync_engine, "before_cursor_execute", listener)
+        assert statements and not [statement for statement in statements if re.search(r"\bitem\b(?!_)", statement)]
+
+        response = test_client.get("/api/v1/items", headers={**headers, "If-None-Match": '"other"'})
+        assert response.status_code == 200 and response.json()["testuser1"]
+
+    @staticmethod
+    def test_item_changes_move_etag(test_client, test_session, token):
+        """Test creating, deleting and transferring items changes the ETag of the users concerned."""
+        headers = {"Authorization": f"Bearer {token}"}
+        token2 = test_client.post("api/v1/login", data={"username": "testuser2", "password": "Qwerty123-"})
+        headers2 = {"Authorization": f"Bearer {token2.json()['access_token']}"}
+
+        def etags():
+            return [test_client.get("/api/v1/items", headers=h).headers["etag"] for h in (headers, headers2)]
+
+        seen = [etags()]
+        item_id = test_client.post("/api/v1/items/new", headers=headers, json={"title": "etag_item"}).json()
+        item_id = item_id["item"]["id"]
+        seen.append(etags())
+        link = test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser2"})
+        assert etags() == seen[-1]
+        test_client.get(link.json()["link"], headers=headers2)
+        seen.append(etags())
+        test_client.delete(f"/api/v1/items/:{item_id}", headers=headers2)
+        seen.append(etags())
+
+        user1, user2 = zip(*seen)
+        assert len(set(user1)) == 3 and user1[2] == user1[3]
+        assert user2[0] == user2[1] and len(set(user2)) == 3
 
     @staticmethod
     def test_get_user_items_still_works(test_client, test_session, token):
         """Test items get-view sends 200 & items even if there's any other query in the path."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get("/api/v1/items?q=1", headers=headers)
-                assert response.status_code == 200
-                assert response.json()
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items?q=1", headers=headers)
+        assert response.status_code == 200
+        assert response.json()
 
 
 class TestCreateNewItem:
@@ -68,13 +144,39 @@ class TestCreateNewItem:
     @staticmethod
     def test_create_new_item(test_client, test_session, token):
         """Test create new item."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                payload = json.dumps({"title": "new_awesome_item"})
-                response = test_client.post("/api/v1/items/new", headers=headers, data=payload)
-                assert response.status_code == 201
-                assert response.json()
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = json.dumps({"title": "new_awesome_item"})
+        response = test_client.post("/api/v1/items/new", headers=headers, data=payload)
+        assert response.status_code == 201
+        assert response.json()
+
+    @staticmethod
+    def test_create_new_item_is_one_statement(test_client, engine, test_session, token):
+        """Test an item is created with a single INSERT which returns its id, next to its event and version rows."""
+        headers = {"Authorization": f"Bearer {token}"}
+        test_client.get("/api/v1/items", headers=headers)
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            payload = json.dumps({"title": "one_statement_item"})
+            response = test_client.post("/api/v1/items/new", headers=headers, data=payload)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", listener)
+        assert response.status_code == 201
+        item = response.json()["item"]
+        assert item["title"] == "one_statement_item"
+        assert item["username"] == "testuser1"
+        assert {"id": item["id"], "title": "one_statement_item"} in test_client.get(
+            "/api/v1/items", headers=headers
+        ).json()["testuser1"]
+        assert len(statements) == 3
+        assert statements[0].startswith("INSERT INTO item ")
+        assert statements[1].startswith("INSERT INTO item_version")
+        assert statements[2].startswith("INSERT INTO cache_event")
 
     @staticmethod
     def test_create_new_item_unauthorized(test_client, exchange_link):
@@ -85,23 +187,83 @@ class TestCreateNewItem:
     @staticmethod
     def test_create_new_item_invalid_token(test_client, test_session, token):
         """Test view sends 401 for invalid token."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.users_list.session", test_session):
-                headers = {"Authorization": f"Bearer {token}+a"}
-                response = test_client.post("/api/v1/items/new", headers=headers)
-                assert response.status_code == 401
+        headers = {"Authorization": f"Bearer {token}+a"}
+        response = test_client.post("/api/v1/items/new", headers=headers)
+        assert response.status_code == 401
 
     @staticmethod
     def test_create_new_item_with_the_same_title(test_client, test_session, token):
         """Test fail to create more than 1 item with the same title."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                payload = json.dumps({"title": "new_awesome_item"})
-                test_client.post("/api/v1/items/new", headers=headers, data=payload)
-                response = test_client.post("/api/v1/items/new", headers=headers, data=payload)
-                assert response.status_code == 400
-                assert response.json()
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = json.dumps({"title": "new_awesome_item"})
+        test_client.post("/api/v1/items/new", headers=headers, data=payload)
+        response = test_client.post("/api/v1/items/new", headers=headers, data=payload)
+        assert response.status_code == 400
+        assert response.json()
+
+
+class TestCreateItemsBulk:
+    """Test the work of bulk item creation method."""
+
+    @staticmethod
+    def test_create_items_bulk(test_client, test_session, token):
+        """Test new items are created and stored or repeated titles reported as duplicates."""
+        headers = {"Authorization": f"Bearer {token}"}
+        titles = ["bulk1", "item1-1", "bulk2", "bulk1", "item2-1"]
+        payload = json.dumps([{"title": title} for title in titles])
+        response = test_client.post("/api/v1/items/bulk", headers=headers, data=payload)
+        assert response.status_code == 201
+        result = response.json()
+        assert (result["created"], result["duplicates"]) == (2, 3)
+        assert [item["status"] for item in result["items"]] == [
+            "created",
+            "duplicate",
+            "created",
+            "duplicate",
+            "duplicate",
+        ]
+
+        items = test_client.get("/api/v1/items", headers=headers).json()["testuser1"]
+        assert {"id": result["items"][0]["id"], "title": "bulk1"} in items
+
+    @staticmethod
+    def test_create_items_bulk_ndjson(test_client, test_session, token):
+        """Test items are accepted as NDJSON and inserted across several batches."""
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"}
+        payload = "\n".join(json.dumps({"title": f"ndjson{i}"}) for i in range(1000))
+        response = test_client.post("/api/v1/items/bulk", headers=headers, data=payload)
+        assert response.status_code == 201
+        assert response.json()["created"] == 1000
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        ("payload", "content_type"),
+        [
+            ('{"title": "a"}', "application/json"),
+            ('[{"name": "a"}]', "application/json"),
+            ("not json", "application/json"),
+            ('{"title": "a"}\n{"name": "b"}', "application/x-ndjson"),
+        ],
+    )
+    def test_create_items_bulk_invalid(test_client, test_session, token, payload, content_type):
+        """Test invalid payloads are rejected before anything is stored."""
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": content_type}
+        response = test_client.post("/api/v1/items/bulk", headers=headers, data=payload)
+        assert response.status_code == 422
+
+    @staticmethod
+    def test_create_items_bulk_too_many(test_client, test_session, token):
+        """Test the number of items per request is limited."""
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = json.dumps([{"title": f"many{i}"} for i in range(settings.BULK_MAX_ITEMS + 1)])
+        response = test_client.post("/api/v1/items/bulk", headers=headers, data=payload)
+        assert response.status_code == 413
+
+    @staticmethod
+    def test_create_items_bulk_unauthorized(test_client):
+        """Test view sends 401 for unauthorized user."""
+        response = test_client.post("/api/v1/items/bulk", data="[]")
+        assert response.status_code == 401
 
 
 class TestDeleteItem:
@@ -110,12 +272,10 @@ class TestDeleteItem:
     @staticmethod
     def test_delete_one_item(test_client, test_session, token):
         """Test delete one item by id."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.delete("/api/v1/items/:1", headers=headers)
-                assert response.status_code == 200  # Actually it should be 204
-                assert "successfully deleted" in response.json()["message"]
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.delete("/api/v1/items/:1", headers=headers)
+        assert response.status_code == 200  # Actually it should be 204
+        assert "successfully deleted" in response.json()["message"]
 
     @staticmethod
     def test_delete_one_item_unauthorized(test_client):
@@ -126,22 +286,80 @@ class TestDeleteItem:
     @staticmethod
     def test_delete_one_item_invalid_token(test_client, test_session, token):
         """Test view sends 401 for invalid token."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.users_list.session", test_session):
-                headers = {"Authorization": f"Bearer {token}+a"}
-                response = test_client.delete("/api/v1/items/:2", headers=headers)
-                assert response.status_code == 401
+        headers = {"Authorization": f"Bearer {token}+a"}
+        response = test_client.delete("/api/v1/items/:2", headers=headers)
+        assert response.status_code == 401
 
     @staticmethod
     def test_twice_delete_one_item(test_client, test_session, token):
         """Test fail to delete one item twice."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                test_client.delete("/api/v1/items/:2", headers=headers)
+        headers = {"Authorization": f"Bearer {token}"}
+        test_client.delete("/api/v1/items/:2", headers=headers)
 
-                response = test_client.delete("/api/v1/items/:2", headers=headers)
-                assert response.status_code == 404
+        response = test_client.delete("/api/v1/items/:2", headers=headers)
+        assert response.status_code == 404
+
+    @staticmethod
+    def test_delete_item_of_another_user(test_client, test_session, token):
+        """Test an item of another user is reported as missing and kept."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.delete("/api/v1/items/:3", headers=headers)
+        assert response.status_code == 404
+
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        response = test_client.delete("/api/v1/items/:3", headers={"Authorization": f"Bearer {token2}"})
+        assert response.status_code == 200
+        assert response.json()["message"] == "Item 3 was successfully deleted"
+
+    @staticmethod
+    def test_bulk_delete_by_ids(test_client, test_session, engine, token):
+        """Test ids are deleted in batches of conditional DELETEs, skipping other users' items."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": f"bulk-delete-{i}"} for i in range(1000)]
+        created = test_client.post("/api/v1/items/bulk", headers=headers, json=items).json()["items"]
+        item_ids = [item["id"] for item in created]
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            payload = {"item_ids": item_ids + item_ids[:5] + [4, 10 ** 6]}
+            response = test_client.delete("/api/v1/items/bulk", headers=headers, json=payload)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        assert response.status_code == 200
+        assert response.json() == {"deleted": 1000}
+        batches = -(-1002 // settings.BULK_BATCH_SIZE)
+        deletes = [statement for statement in statements if statement.startswith("DELETE FROM item ")]
+        assert len(deletes) == batches
+        assert all("item.user_id = ?" in statement for statement in deletes)
+        offers = [statement for statement in statements if statement.startswith("DELETE FROM pending_transfer ")]
+        assert len(offers) == batches
+        assert not [statement for statement in statements if statement.startswith("SELECT")]
+
+    @staticmethod
+    def test_bulk_delete_by_title_pattern(test_client, test_session, token):
+        """Test a LIKE pattern deletes the matching items of the user only."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": "cleanup-1"}, {"title": "cleanup-2"}, {"title": "keep-cleanup"}]
+        test_client.post("/api/v1/items/bulk", headers=headers, json=items)
+
+        response = test_client.delete("/api/v1/items/bulk", headers=headers, json={"title_pattern": "cleanup-%"})
+        assert response.json() == {"deleted": 2}
+        response = test_client.delete("/api/v1/items/bulk", headers=headers, json={"title_pattern": "item2-%"})
+        assert response.json() == {"deleted": 0}
+
+    @staticmethod
+    @pytest.mark.parametrize("payload", [{}, {"item_ids": [1], "title_pattern": "%"}, {"item_ids": "all"}])
+    def test_bulk_delete_requires_one_selection(test_client, test_session, token, payload):
+        """Test exactly one of item_ids and title_pattern is accepted."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.delete("/api/v1/items/bulk", headers=headers, json=payload)
+        assert response.status_code == 422
 
 
 class TestExchange:
@@ -151,15 +369,13 @@ class TestExchange:
     @pytest.mark.parametrize("item_id", [1, 2, "1", "2"])
     def test_send(test_client, test_session, token, item_id):
         """Test send view creates a link for an item transfer."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                transfer_data = {"item_id": item_id, "achiever": "testuser2"}
-                payload = json.dumps(transfer_data)
-                response = test_client.post("/api/v1/send", headers=headers, data=payload)
-                message = response.json()
-                assert response.status_code == 200
-                assert "/api/v1/get?transfer_key=eyJ" in message["link"]
+        headers = {"Authorization": f"Bearer {token}"}
+        transfer_data = {"item_id": item_id, "achiever": "testuser2"}
+        payload = json.dumps(transfer_data)
+        response = test_client.post("/api/v1/send", headers=headers, data=payload)
+        message = response.json()
+        assert response.status_code == 200
+        assert "/api/v1/get?transfer_key=eyJ" in message["link"]
 
     @staticmethod
     @pytest.mark.parametrize(
@@ -167,91 +383,71 @@ class TestExchange:
     )
     def test_send_returns_fail_on_item(test_client, test_session, token, item_id):
         """Test send view returns 400 or 422 due to wrong or absent item_id."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                transfer_data = {"item_id": item_id, "achiever": "testuser2"}
-                payload = json.dumps(transfer_data)
-                response = test_client.post("/api/v1/send", headers=headers, data=payload)
-                assert response.status_code in (400, 422)
+        headers = {"Authorization": f"Bearer {token}"}
+        transfer_data = {"item_id": item_id, "achiever": "testuser2"}
+        payload = json.dumps(transfer_data)
+        response = test_client.post("/api/v1/send", headers=headers, data=payload)
+        assert response.status_code in (400, 422)
 
     @staticmethod
     @pytest.mark.parametrize("achiever", [-1, 0, 10, "-1", "0", "10", "", " ", "\n", "one", "user1", "testuser1"])
     def test_send_returns_fail_on_achiever(test_client, test_session, token, achiever):
         """Test send view returns 400 or 422 due to wrong or absent achiever."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                transfer_data = {"item_id": 1, "achiever": achiever}
-                payload = json.dumps(transfer_data)
-                response = test_client.post("/api/v1/send", headers=headers, data=payload)
-                assert response.status_code in (400, 422)
+        headers = {"Authorization": f"Bearer {token}"}
+        transfer_data = {"item_id": 1, "achiever": achiever}
+        payload = json.dumps(transfer_data)
+        response = test_client.post("/api/v1/send", headers=headers, data=payload)
+        assert response.status_code in (400, 422)
 
     @staticmethod
     def test_get_item_transfer(test_client, test_session, exchange_link, token):
         """Test successful item transfer."""
         # login testuser2 and get his access_token
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser2", "password": "Qwerty123-"}
-                response = test_client.post("api/v1/login", data=payload).json()
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        response = test_client.post("api/v1/login", data=payload).json()
         token = response["access_token"]
 
         # testuser2 follows the link to obtain item1-1
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get(exchange_link, headers=headers)
-                assert response.status_code == 200
-                assert response.json()["message"] == "You've just obtained item1-1"
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get(exchange_link, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["message"] == "You've just obtained item1-1"
 
     @staticmethod
-    def test_get_item_transfer_with_2_valid_keys(test_client, test_session, exchange_link, exchange_link2, token):
+    def test_get_item_transfer_with_2_valid_keys(test_client, test_session, token):
         """Test two valid keys for one item."""
-        # login testuser2 and get his access_token
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser2", "password": "Qwerty123-"}
-                response = test_client.post("api/v1/login", data=payload).json()
-        token = response["access_token"]
-
-        # testuser2 follows the link to obtain item1-1
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                test_client.get(exchange_link, headers=headers)
-
-        # login testuser3 and get his access_token
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser3", "password": "Qwerty123_"}
-                response = test_client.post("api/v1/login", data=payload).json()
-        token = response["access_token"]
-
-        # testuser3 follows the link to obtain item1-1
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get(exchange_link2, headers=headers)
-                print(response.json())
-                assert response.status_code == 400
-                assert response.json()["detail"] == "Item item1-1 was already passed to another user"
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.post("/api/v1/items/new", headers=headers, json={"title": "item-two-keys"})
+        item_id = response.json()["item"]["id"]
+        links = [
+            test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": achiever})
+            for achiever in ("testuser2", "testuser3")
+        ]
+
+        # testuser2 follows the link to obtain item-two-keys
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        response = test_client.get(links[0].json()["link"], headers={"Authorization": f"Bearer {token2}"})
+        assert response.status_code == 200
+
+        # testuser3 follows the link to obtain item-two-keys
+        payload = {"username": "testuser3", "password": "Qwerty123_"}
+        token3 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        response = test_client.get(links[1].json()["link"], headers={"Authorization": f"Bearer {token3}"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Item item-two-keys was already passed to another user"
 
     @staticmethod
     def test_get_item_transfer_twice(test_client, test_session, exchange_link):
         """Test one item can't be obtained more than once."""
         # login testuser2 and get his access_token
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser2", "password": "Qwerty123-"}
-                response = test_client.post("api/v1/login", data=payload).json()
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        response = test_client.post("api/v1/login", data=payload).json()
         token = response["access_token"]
 
         for _ in range(2):
-            with patch("validators.authentication.session", test_session):
-                with patch("views.items.session", test_session):
-                    headers = {"Authorization": f"Bearer {token}"}
-                    response = test_client.get(exchange_link, headers=headers)
+            headers = {"Authorization": f"Bearer {token}"}
+            response = test_client.get(exchange_link, headers=headers)
         assert response.status_code == 400
         assert response.json()["detail"] == "Item item1-1 is already yours"
 
@@ -259,12 +455,92 @@ class TestExchange:
     def test_get_item_transfer_fail(test_client, test_session, exchange_link, token):
         """Test a fail of item transfer due to wrong user opened a link for someone else."""
         # testuser1 follows the link made for testuser2
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get(exchange_link, headers=headers)
-                assert response.status_code == 403
-                assert response.json()["detail"] == "Sorry, this link isn't for you"
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get(exchange_link, headers=headers)
+        assert response.status_code == 403
+        assert response.json()["detail"] == "Sorry, this link isn't for you"
+
+    @staticmethod
+    def test_get_deleted_item(test_client, test_session, token):
+        """Test a link to an item deleted meanwhile gets 404."""
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = json.dumps({"title": "short_lived_item"})
+        item_id = test_client.post("/api/v1/items/new", headers=headers, data=payload).json()["item"]["id"]
+        test_client.delete(f"/api/v1/items/:{item_id}", headers=headers)
+
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        key = generate_exchange_token(1, 2, item_id, settings.SECRET_KEY)
+        response = test_client.get(f"/api/v1/get?transfer_key={key}", headers={"Authorization": f"Bearer {token2}"})
+        assert response.status_code == 404
+
+    @staticmethod
+    def test_claim_is_done_with_the_writer_at_commit(test_client, test_session, engine, token):
+        """Test nothing runs on the writer connection after a claim commits."""
+        headers = {"Authorization": f"Bearer {token}"}
+        item_id = test_client.post("/api/v1/items/new", headers=headers, json={"title": "claimed_item"})
+        link = test_client.post(
+            "/api/v1/send", headers=headers, json={"item_id": item_id.json()["item"]["id"], "achiever": "testuser2"}
+        )
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        calls = []
+
+        def statement(conn, cursor, statement, *args):
+            calls.append(statement)
+
+        def commit(conn):
+            calls.append("COMMIT")
+
+        event.listen(engine.sync_engine, "before_cursor_execute", statement)
+        event.listen(engine.sync_engine, "commit", commit)
+        try:
+            response = test_client.get(link.json()["link"], headers={"Authorization": f"Bearer {token2}"})
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", statement)
+            event.remove(engine.sync_engine, "commit", commit)
+        assert response.json() == {"message": "You've just obtained claimed_item"}
+        assert calls[-1] == "COMMIT"
+        assert any(call.startswith("SELECT item.title") for call in calls)
+
+    @staticmethod
+    def test_link_to_deleted_item_does_not_pass_its_id_on(test_client, test_session, token):
+        """Test deleting an item voids its offers, so they can't hand over a later item reusing its id."""
+        headers = {"Authorization": f"Bearer {token}"}
+        item_id = test_client.post("/api/v1/items/new", headers=headers, json={"title": "deleted_offer"})
+        item_id = item_id.json()["item"]["id"]
+        link = test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser2"})
+        test_client.delete(f"/api/v1/items/:{item_id}", headers=headers)
+        response = test_client.post("/api/v1/items/new", headers=headers, json={"title": "secret-new"})
+        assert response.json()["item"]["id"] == item_id
+
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        response = test_client.get(link.json()["link"], headers={"Authorization": f"Bearer {token2}"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "This link has already been used or has expired"
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_concurrent_claims(test_session, token, event_loop_pools):
+        """Test hundreds of simultaneous claims of one item: exactly one of them wins."""
+        client = ASGIClient(app)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = await client.post("/api/v1/items/new", headers=headers, json_body={"title": "contested_item"})
+        item_id = response.json()["item"]["id"]
+
+        claims = []
+        for username, password in (("testuser2", "Qwerty123-"), ("testuser3", "Qwerty123_")):
+            form = {"username": username, "password": password}
+            achiever_token = (await client.post("/api/v1/login", form=form)).json()["access_token"]
+            transfer_data = {"item_id": item_id, "achiever": username}
+            link = (await client.post("/api/v1/send", headers=headers, json_body=transfer_data)).json()["link"]
+            claims += [(link, {"Authorization": f"Bearer {achiever_token}"})] * 150
+
+        responses = await asyncio.gather(*(client.get(link, headers=headers) for link, headers in claims))
+        codes = [response.status_code for response in responses]
+        assert codes.count(200) == 1
+        assert codes.count(400) == len(claims) - 1
 
     @staticmethod
     def test_get_item_unauthorized(test_client, exchange_link, token):
@@ -275,32 +551,118 @@ class TestExchange:
     @staticmethod
     def test_get_item_no_transfer_key(test_client, test_session, token):
         """Test a fail of item transfer due to no transfer key."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get("api/v1/get?transfer_key=", headers=headers)
-                assert response.status_code == 404
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("api/v1/get?transfer_key=", headers=headers)
+        assert response.status_code == 404
 
     @staticmethod
     @pytest.mark.parametrize("key", [None, False, True, " ", -1, 0, 1, "-1", "0", "1", "a", "any other string"])
     def test_get_item_wrong_transfer_key(test_client, test_session, token, key):
         """Test a fail of item transfer due to no transfer key."""
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get(f"api/v1/get?transfer_key={key}", headers=headers)
-                assert response.status_code == 401
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get(f"api/v1/get?transfer_key={key}", headers=headers)
+        assert response.status_code == 401
 
     @staticmethod
     def test_get_item_invalid_transfer_key(test_client, test_session, token):
         """Test a fail of item transfer due to invalid transfer key."""
         key = create_access_token(1, settings.SECRET_KEY, {"minutes": 1})
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get(f"api/v1/get?transfer_key={key}", headers=headers)
-                assert response.status_code == 400
-                assert response.json()["detail"] == "Invalid key"
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get(f"api/v1/get?transfer_key={key}", headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid key"
+
+
+class TestMultiItemTransfer:
+    """Test links moving many items at once."""
+
+    @staticmethod
+    def test_packed_ids_round_trip():
+        """Test id sets survive packing and runs of ids pack to a few bytes."""
+        item_ids = [5, 3, 1, 2, 3, 100, 101, 102, 7000]
+        assert unpack_ids(pack_ids(item_ids)) == [1, 2, 3, 5, 100, 101, 102, 7000]
+        assert unpack_ids(pack_ids([])) == []
+        assert len(pack_ids(range(10000, 15000))) < 32
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "transfer_data",
+        [
+            {"achiever": "testuser2"},
+            {"item_id": 1, "item_ids": [1], "achiever": "testuser2"},
+            {"item_ids": [1], "title_prefix": "item", "achiever": "testuser2"},
+            {"item_ids": ["one"], "achiever": "testuser2"},
+        ],
+    )
+    def test_send_requires_one_selection(test_client, test_session, token, transfer_data):
+        """Test exactly one of item_id, item_ids and title_prefix is accepted."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.post("/api/v1/send", headers=headers, json=transfer_data)
+        assert response.status_code == 422
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "transfer_data",
+        [
+            {"item_ids": [3, 4, 100], "achiever": "testuser2"},
+            {"title_prefix": "item2-", "achiever": "testuser2"},
+            {"item_ids": [1], "achiever": "testuser1"},
+            {"item_ids": [1], "achiever": "nobody"},
+        ],
+    )
+    def test_send_without_owned_items_fails(test_client, test_session, token, transfer_data):
+        """Test a link needs at least one item of the sender and another achiever."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.post("/api/v1/send", headers=headers, json=transfer_data)
+        assert response.status_code == 400
+
+    @staticmethod
+    def test_transfer_reports_transferred_and_skipped(test_client, test_session, token):
+        """Test one claim moves the items still owned by the sender and reports the others."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": f"bulk-transfer-{i}"} for i in range(300)]
+        created = test_client.post("/api/v1/items/bulk", headers=headers, json=items).json()["items"]
+        item_ids = [item["id"] for item in created]
+
+        transfer_data = {"item_ids": item_ids + [3], "achiever": "testuser2"}
+        response = test_client.post("/api/v1/send", headers=headers, json=transfer_data)
+        assert response.status_code == 200
+        assert response.json()["items"] == 300
+        link = response.json()["link"]
+        test_client.delete(f"/api/v1/items/:{item_ids[0]}", headers=headers)
+
+        payload = {"username": "testuser2", "password": "Qwerty123-"}
+        token2 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        headers2 = {"Authorization": f"Bearer {token2}"}
+        response = test_client.get(link, headers=headers2)
+        assert response.status_code == 200
+        result = response.json()
+        assert result["transferred"] == item_ids[1:]
+        assert result["skipped"] == item_ids[:1]
+        assert result["message"] == "You've just obtained 299 of 300 items"
+
+        response = test_client.get(link, headers=headers2)
+        assert response.json()["transferred"] == [] and len(response.json()["skipped"]) == 300
+        owned = test_client.get("/api/v1/items/?limit=1000", headers=headers2).json()["testuser2"]
+        assert {item["id"] for item in owned} >= set(item_ids[1:])
+
+    @staticmethod
+    def test_transfer_by_title_prefix(test_client, test_session, token):
+        """Test a title prefix selects the sender's matching items, with LIKE wildcards taken literally."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": "prefix_a"}, {"title": "prefix_b"}, {"title": "prefixXc"}]
+        item_ids = [
+            item["id"] for item in test_client.post("/api/v1/items/bulk", headers=headers, json=items).json()["items"]
+        ]
+
+        transfer_data = {"title_prefix": "prefix_", "achiever": "testuser3"}
+        response = test_client.post("/api/v1/send", headers=headers, json=transfer_data)
+        assert response.json()["items"] == 2
+
+        payload = {"username": "testuser3", "password": "Qwerty123_"}
+        token3 = test_client.post("api/v1/login", data=payload).json()["access_token"]
+        response = test_client.get(response.json()["link"], headers={"Authorization": f"Bearer {token3}"})
+        assert response.json()["transferred"] == item_ids[:2]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+"""Test the streaming fixture loader."""
+import io
+import json
+
+import pytest
+from sqlalchemy import event, func, select
+
+from database.loader import FixtureError, iter_records, load_fixture
+from database.models import Base, Item, User
+from services.hashing import pwd_context
+
+
+def fixture_records(users: int, items: int, hashed: bool = False) -> list:
+    password = pwd_context.hash("Qwerty123_") if hashed else "Qwerty123_"
+    records = [
+        {"model": "User", "fields": {"username": f"user{i}", "password": password, "hashed": hashed}}
+        for i in range(users)
+    ]
+    records += [{"model": "Item", "fields": {"title": f"item{i}", "user_id": 1}} for i in range(items)]
+    return records
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_records_are_streamed(chunk_size):
+    """Test records are decoded whatever chunks the file is read in."""
+    records = fixture_records(users=3, items=20)
+    file = io.StringIO(json.dumps(records, indent=2))
+    assert list(iter_records(file, chunk_size=chunk_size)) == records
+
+
+@pytest.mark.parametrize("content", ['{"model": "User"}', "[{}, ", '[{"model": }]'])
+def test_malformed_fixture(content):
+    """Test a broken fixture file is reported."""
+    with pytest.raises(FixtureError):
+        list(iter_records(io.StringIO(content), chunk_size=4))
+
+
+@pytest.mark.asyncio
+async def test_fixture_is_loaded_in_batches(engine, tmp_path):
+    """Test rows are inserted with one executemany per batch and progress is reported."""
+    path = tmp_path / "load.json"
+    path.write_text(json.dumps(fixture_records(users=2, items=25, hashed=True)))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    statements, reports = [], []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(executemany)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        loaded = await load_fixture(
+            str(path), bind=engine, batch_size=10, progress=lambda rows, elapsed: reports.append(rows)
+        )
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    assert loaded == 27
+    assert reports == [2, 12, 22, 27]
+    assert statements == [True] * 4
+    async with engine.connect() as conn:
+        count_items = await conn.run_sync(lambda sync: sync.execute(select(func.count(Item.id))).scalar())
+        password = await conn.run_sync(lambda sync: sync.execute(select(User.password)).scalars().first())
+    assert count_items == 25
+    assert pwd_context.verify("Qwerty123_", password)
+
+
+@pytest.mark.asyncio
+async def test_passwords_are_hashed_in_processes(engine, tmp_path):
+    """Test plain passwords are hashed by a pool of worker processes."""
+    path = tmp_path / "load.json"
+    path.write_text(json.dumps(fixture_records(users=3, items=0)))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    assert await load_fixture(str(path), bind=engine, workers=2) == 3
+    async with engine.connect() as conn:
+        passwords = await conn.run_sync(lambda sync: sync.execute(select(User.password)).scalars().fetchall())
+    assert len(passwords) == 3
+    assert all(pwd_context.verify("Qwerty123_", password) for password in passwords)
+
+
+if __name__ == "__main__":
+    pytest.main()
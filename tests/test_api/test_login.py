@@ -1,9 +1,10 @@
 """Test login view."""
 import time
 from random import randint
-from unittest.mock import patch
 
+import jwt
 import pytest
+from sqlalchemy import event
 
 from config import get_settings
 
@@ -12,23 +13,19 @@ settings = get_settings()
 
 def test_normal_logging_in(test_client, test_session):
     """Test successful login."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.login.session", test_session):
-            payload = {"username": "testuser1", "password": "Qwerty123_"}
-            response = test_client.post("api/v1/login", data=payload)
-            assert response.status_code == 200
-            assert response.json()["access_token"]
+    payload = {"username": "testuser1", "password": "Qwerty123_"}
+    response = test_client.post("api/v1/login", data=payload)
+    assert response.status_code == 200
+    assert response.json()["access_token"]
 
 
 def test_twice_logging_in(test_client, test_session):
     """Test twice successful login but tokens differ."""
     tokens = []
     for _ in range(2):
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser1", "password": "Qwerty123_"}
-                response = test_client.post("api/v1/login", data=payload)
-                assert response.status_code == 200
+        payload = {"username": "testuser1", "password": "Qwerty123_"}
+        response = test_client.post("api/v1/login", data=payload)
+        assert response.status_code == 200
         tokens.append(response.json()["access_token"])
         time.sleep(1)
     assert tokens[0] != tokens[1]
@@ -38,52 +35,61 @@ def test_only_last_token_is_valid(test_client, test_session):
     """Test only the last obtained token is valid."""
     tokens = []
     for _ in range(randint(2, 10)):
-        with patch("validators.authentication.session", test_session):
-            with patch("views.login.session", test_session):
-                payload = {"username": "testuser1", "password": "Qwerty123_"}
-                response1 = test_client.post("api/v1/login", data=payload)
-                tokens.append(response1.json()["access_token"])
+        payload = {"username": "testuser1", "password": "Qwerty123_"}
+        response1 = test_client.post("api/v1/login", data=payload)
+        tokens.append(response1.json()["access_token"])
         time.sleep(1)
 
     status_codes = []
     for token in tokens:
-        with patch("validators.authentication.session", test_session):
-            with patch("views.items.session", test_session):
-                headers = {"Authorization": f"Bearer {token}"}
-                response = test_client.get("/api/v1/items", headers=headers)
-                status_codes.append(response.status_code)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.get("/api/v1/items", headers=headers)
+        status_codes.append(response.status_code)
     last_code = status_codes.pop()
     assert last_code == 200
     assert set(status_codes) == {401}
 
 
+def test_login_reads_the_current_token_under_the_write_lock(test_client, test_session, engine):
+    """Test the current token is read after a write began, so concurrent logins get distinct generations."""
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    payload = {"username": "testuser1", "password": "Qwerty123_"}
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        tokens = [test_client.post("api/v1/login", data=payload).json()["access_token"] for _ in range(2)]
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert statements[0].startswith("UPDATE user_token")
+    assert statements[1].startswith("SELECT user_token")
+    generations = [jwt.decode(token, options={"verify_signature": False}).get("gen") for token in tokens]
+    assert generations[1] == generations[0] + 1
+
+
 @pytest.mark.parametrize(("username", "code"), [("", 422), (" ", 401), ("user1", 401), (1, 401)])
 def test_wrong_username(test_client, test_session, username, code):
     """Test login with wrong username."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.login.session", test_session):
-            payload = {"username": username, "password": "Qwerty123_"}
-            response = test_client.post("api/v1/login", data=payload)
-            assert response.status_code == code
+    payload = {"username": username, "password": "Qwerty123_"}
+    response = test_client.post("api/v1/login", data=payload)
+    assert response.status_code == code
 
 
 @pytest.mark.parametrize(("password", "code"), [("", 422), (" ", 401), ("qwerty123_", 401), (1, 401)])
 def test_wrong_password(test_client, test_session, password, code):
     """Test login with wrong password."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.login.session", test_session):
-            payload = {"username": "testuser1", "password": password}
-            response = test_client.post("api/v1/login", data=payload)
-            assert response.status_code == code
+    payload = {"username": "testuser1", "password": password}
+    response = test_client.post("api/v1/login", data=payload)
+    assert response.status_code == code
 
 
 def test_no_credentials(test_client, test_session):
     """Test login with empty credentials."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.login.session", test_session):
-            payload = {"username": "", "password": ""}
-            response = test_client.post("api/v1/login", data=payload)
-            assert response.status_code == 422
+    payload = {"username": "", "password": ""}
+    response = test_client.post("api/v1/login", data=payload)
+    assert response.status_code == 422
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""Test the metrics middleware and endpoint."""
+import logging
+import re
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks.client import ASGIClient
+from config import Settings
+from database.engine import create_write_engine, keep_alive, memory_database_url
+from main import app
+from services.metrics import Counter, Gauge, Histogram, QueryStats, Registry, ServerTimingMiddleware, current_queries
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of the sample with exactly these labels."""
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + ("{" + rendered + "}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    assert match, f"no sample {name} {labels}"
+    return float(match.group(1))
+
+
+def test_exposition_format():
+    """Test metrics are rendered with cumulative histogram buckets."""
+    registry = Registry()
+    counter = registry.register(Counter("jobs_total", "Jobs.", ("kind",)))
+    gauge = registry.register(Gauge("depth", "Depth.", function=lambda: 3))
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    counter.inc(('a"b',))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{kind="a\\"b"} 1' in text
+    assert sample(text, "depth") == 3 and gauge.function() == 3
+    assert sample(text, "latency_seconds_bucket", le="0.1") == 1
+    assert sample(text, "latency_seconds_bucket", le="1.0") == 2
+    assert sample(text, "latency_seconds_bucket", le="+Inf") == 3
+    assert sample(text, "latency_seconds_count") == 3
+    with pytest.raises(ValueError):
+        registry.register(Counter("jobs_total", "Again."))
+
+
+class TestMetricsEndpoint:
+    def test_requests_are_recorded_per_route_template(self, test_client, test_session, token):
+        """Test requests are labelled with the route template and their queries are counted."""
+        headers = {"Authorization": f"Bearer {token}"}
+        before = test_client.get("/metrics").text
+        route = "/api/v1/items/:{item_id}"
+        labels = {"method": "DELETE", "route": route, "status": "404"}
+        deleted_before = sample(before, "http_requests_total", **labels) if route in before else 0
+        for item_id in (1000, 1001):
+            assert test_client.delete(f"/api/v1/items/:{item_id}", headers=headers).status_code == 404
+        test_client.get("/api/v1/items/", headers=headers)
+        test_client.get("/no/such/path")
+
+        response = test_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        assert sample(text, "http_requests_total", **labels) == deleted_before + 2
+        assert sample(text, "http_requests_in_flight", method="DELETE", route=route) == 0
+        assert sample(text, "http_request_duration_seconds_count", method="GET", route="/api/v1/items/") >= 1
+        assert sample(text, "http_requests_total", method="GET", route="unmatched", status="404") >= 1
+        assert sample(text, "db_queries_per_request_sum", route="/api/v1/items/") >= 1
+        assert sample(text, "db_queries_total") > 0
+        assert sample(text, "hash_pool_queue_depth") == 0
+        assert sample(text, "hash_pool_duration_seconds_count") >= 1
+
+    def test_cache_counters_are_exported(self, test_client, test_session, token):
+        """Test the in-process caches of authentication and the users list report their hits and misses."""
+
+        def lookups(text: str) -> float:
+            return sum(
+                sample(text, name, cache=cache)
+                for name in ("cache_hits_total", "cache_misses_total")
+                for cache in ("principal", "token_generations")
+            )
+
+        headers = {"Authorization": f"Bearer {token}"}
+        before = lookups(test_client.get("/metrics").text)
+        for _ in range(2):
+            test_client.get("/api/v1/users", headers=headers)
+        text = test_client.get("/metrics").text
+        assert lookups(text) >= before + 2
+        assert sample(text, "cache_hits_total", cache="users_list") >= 1
+        assert sample(text, "cache_entries", cache="users_list") == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_are_logged(caplog):
+    """Test statements above the threshold are logged with parameters and route."""
+    url = memory_database_url("owm-test-slow-query")
+    anchor = keep_alive(url)
+    engine = create_write_engine(url, Settings(SLOW_QUERY_MS=0))
+    token = current_queries.set(QueryStats("/api/v1/send"))
+    try:
+        with caplog.at_level(logging.WARNING, logger="services.metrics"):
+            async with engine.connect() as connection:
+                await connection.run_sync(lambda sync: sync.execute(text("SELECT :value"), {"value": 42}))
+    finally:
+        current_queries.reset(token)
+        await engine.dispose()
+        anchor.close()
+    message = caplog.records[-1].getMessage()
+    assert "Slow query" in message and "/api/v1/send" in message
+    assert "SELECT ?" in message and "42" in message
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_hides_secrets(caplog):
+    """Test parameters of statements on tokens and password hashes are logged as types and lengths."""
+    url = memory_database_url("owm-test-slow-secret")
+    anchor = keep_alive(url)
+    engine = create_write_engine(url, Settings(SLOW_QUERY_MS=0))
+
+    def run(sync):
+        sync.execute(text('CREATE TABLE "user" (username VARCHAR, password VARCHAR)'))
+        sync.execute(text("CREATE TABLE user_token (token VARCHAR, user_id INTEGER)"))
+        sync.execute(
+            text('INSERT INTO "user" (username, password) VALUES (:name, :hash)'), {"name": "u", "hash": "$2b$x"}
+        )
+        sync.execute(text("UPDATE user_token SET token = :token WHERE user_id = 1"), {"token": "secret.jwt"})
+
+    try:
+        with caplog.at_level(logging.WARNING, logger="services.metrics"):
+            async with engine.connect() as connection:
+                await connection.run_sync(run)
+    finally:
+        await engine.dispose()
+        anchor.close()
+    messages = [record.getMessage() for record in caplog.records if "Slow query" in record.getMessage()]
+    insert, update = messages[-2:]
+    assert "$2b$x" not in insert and "<str len=5>" in insert
+    assert "secret.jwt" not in update and "<str len=10>" in update
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header(test_session, token, event_loop_pools):
+    """Test the queries of a request are reported in its Server-Timing header."""
+    client = ASGIClient(ServerTimingMiddleware(app))
+    response = await client.get("/api/v1/items/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    match = re.fullmatch(r'db;dur=([\d.]+);desc="(\d+) queries", app;dur=([\d.]+)', response.headers["server-timing"])
+    assert match
+    assert int(match.group(2)) >= 1
+    assert float(match.group(1)) <= float(match.group(3))
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,29 +1,76 @@
 """Test models module."""
 
-from unittest.mock import patch
-
 import pytest
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import inspect, select, text
 
+from database.migrations import MigrationError, migrate
 from database.models import Item, User, main
 
+LEGACY_SCHEMA = (
+    "CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(255) NOT NULL, password VARCHAR(255) NOT NULL)",
+    "CREATE TABLE item (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, user_id INTEGER NOT NULL)",
+    "CREATE TABLE user_token (token VARCHAR(255) NOT NULL, user_id INTEGER NOT NULL UNIQUE, "
+    "PRIMARY KEY (token, user_id))",
+)
+
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize(("title", "user_id"), [("item1-1", 1), ("item1-2", 1), ("item2-1", 2), ("item2-2", 2)])
-async def test_main_function(engine, session: AsyncSession, title, user_id):
+async def test_main_function(engine, session, title, user_id):
     """Test database is created and primary inserts are done."""
-    with patch("database.models.engine", engine):
-        with patch("database.models.session", session) as session:
-            await main(test=True)
+    await main(test=True, bind=engine)
 
-    async with session:
+    async with session() as session:
         query = select(Item).where(Item.title == title)
         result = await session.execute(query)
     item = result.scalars().one()
     assert item.user_id == user_id
 
 
+async def create_legacy_database(engine, *statements):
+    """Create tables as they were before indexes were declared on the models."""
+
+    def execute(conn):
+        for table in ("user_token", "item", "user"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for statement in LEGACY_SCHEMA + statements:
+            conn.execute(text(statement))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(execute)
+
+
+@pytest.mark.asyncio
+async def test_migration_creates_missing_indexes(engine):
+    """Test migration adds indexes to a database created without them."""
+    await create_legacy_database(engine)
+    created = await migrate(engine)
+    assert set(created) == {
+        "ix_item_title",
+        "ix_item_user_id",
+        "ix_user_username",
+        # Tables added since are created with their indexes
+        "ix_pending_transfer_achiever_id",
+        "ix_pending_transfer_expires",
+        "ix_pending_transfer_item_achiever",
+    }
+
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_indexes("user"))
+    assert indexes == [{"name": "ix_user_username", "column_names": ["username"], "unique": 1}]
+    assert await migrate(engine) == []
+
+
+@pytest.mark.asyncio
+async def test_migration_reports_duplicates(engine):
+    """Test unique index is not created over duplicated values."""
+    await create_legacy_database(
+        engine, "INSERT INTO user (username, password) VALUES ('user1', 'hash'), ('user1', 'hash')"
+    )
+    with pytest.raises(MigrationError, match="ix_user_username"):
+        await migrate(engine)
+
+
 @pytest.mark.parametrize("example", ["Qwerty", "123456", "", " "])
 def test_hash_password(example):
     """Test user password is being hashed."""
@@ -0,0 +1,65 @@
+"""Test on-demand request profiling."""
+import datetime
+
+import pytest
+
+from benchmarks.client import ASGIClient
+from main import app
+from services.profiling import ProfilingMiddleware, create_profile_token
+
+KEY = "profile-test-key"
+
+
+@pytest.fixture()
+def profile_token():
+    return create_profile_token(KEY)
+
+
+def profiled_client(**kwargs) -> ASGIClient:
+    return ASGIClient(ProfilingMiddleware(app, key=KEY, interval=0.0005, **kwargs))
+
+
+@pytest.mark.asyncio
+async def test_profile_is_returned(test_session, profile_token, event_loop_pools):
+    """Test a request with a profile token gets its collapsed stacks instead of the response."""
+    form = {"username": "testuser1", "password": "Qwerty123_"}
+    response = await profiled_client().post("/api/v1/login", form=form, headers={"X-Profile-Token": profile_token})
+    assert response.status_code == 200
+    assert response.headers["x-profile-status"] == "200"
+    assert int(response.headers["x-profile-samples"]) > 0
+    lines = response.content.decode().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("MainThread;") for line in lines)
+    assert any("hashing.py:_verify" in line for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_profile_is_stored(test_session, token, profile_token, tmp_path, event_loop_pools):
+    """Test profiles are written to the directory and the response is left as it is."""
+    headers = {"Authorization": f"Bearer {token}", "X-Profile-Token": profile_token}
+    response = await profiled_client(directory=str(tmp_path)).get("/api/v1/items/", headers=headers)
+    assert response.status_code == 200 and "testuser1" in response.json()
+    (profile,) = tmp_path.iterdir()
+    assert profile.name.endswith("-GET-api-v1-items.folded")
+    assert profile.read_text()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "profile_header",
+    [
+        create_profile_token("another-key"),
+        create_profile_token(KEY, expires_delta=datetime.timedelta(seconds=-1)),
+        "not-a-token",
+    ],
+)
+async def test_invalid_profile_token_is_ignored(test_session, token, profile_header, event_loop_pools):
+    """Test requests without a valid token are served unprofiled."""
+    headers = {"Authorization": f"Bearer {token}", "X-Profile-Token": profile_header}
+    response = await profiled_client().get("/api/v1/items/", headers=headers)
+    assert response.status_code == 200
+    assert "x-profile-status" not in response.headers
+
+
+if __name__ == "__main__":
+    pytest.main()
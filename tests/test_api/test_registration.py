@@ -1,6 +1,5 @@
 """Test registration view."""
 import json
-from unittest.mock import patch
 
 import pytest
 
@@ -11,35 +10,29 @@ settings = get_settings()
 
 def test_normal_registration(test_client, test_session):
     """Test successful login."""
-    with patch("views.registration.session", test_session):
-        with patch("validators.validation.session", test_session):
-            headers = {"Content-Type": "application/json"}
-            payload = json.dumps({"username": "newtestuser1", "password": "Qwerty123_"})
-            response = test_client.post("api/v1/registration", headers=headers, data=payload)
-            assert response.status_code == 201
-            assert response.json()
+    headers = {"Content-Type": "application/json"}
+    payload = json.dumps({"username": "newtestuser1", "password": "Qwerty123_"})
+    response = test_client.post("api/v1/registration", headers=headers, data=payload)
+    assert response.status_code == 201
+    assert response.json()
 
 
 @pytest.mark.parametrize(("username", "password"), [("", ""), (" ", " "), ("testuser1", ""), ("", "Qwerty123_")])
 def test_wrong_credentials_registration(test_client, test_session, username, password):
     """Test bad credentials fail."""
-    with patch("views.registration.session", test_session):
-        with patch("validators.validation.session", test_session):
-            payload = json.dumps({"username": username, "password": password})
-            headers = {"Content-Type": "application/json"}
-            response = test_client.post("api/v1/registration", headers=headers, data=payload)
-            assert response.status_code == 400
+    payload = json.dumps({"username": username, "password": password})
+    headers = {"Content-Type": "application/json"}
+    response = test_client.post("api/v1/registration", headers=headers, data=payload)
+    assert response.status_code == 400
 
 
 @pytest.mark.parametrize(("username", "password"), [("testuser1", "Qwerty123_"), ("testuser2", "Qwerty123_")])
 def test_usernames_already_used_registration(test_client, test_session, username, password):
     """Test fail to register previously taken usernames."""
-    with patch("views.registration.session", test_session):
-        with patch("validators.validation.session", test_session):
-            payload = json.dumps({"username": username, "password": password})
-            headers = {"Content-Type": "application/json"}
-            response = test_client.post("api/v1/registration", headers=headers, data=payload)
-            assert response.status_code == 400
+    payload = json.dumps({"username": username, "password": password})
+    headers = {"Content-Type": "application/json"}
+    response = test_client.post("api/v1/registration", headers=headers, data=payload)
+    assert response.status_code == 400
 
 
 @pytest.mark.parametrize(
@@ -75,12 +68,10 @@ def test_usernames_already_used_registration(test_client, test_session, username
 )
 def test_weak_password_registration(test_client, test_session, password):
     """Test fail to register weak passwords."""
-    with patch("views.registration.session", test_session):
-        with patch("validators.validation.session", test_session):
-            payload = json.dumps({"username": "username", "password": password})
-            headers = {"Content-Type": "application/json"}
-            response = test_client.post("api/v1/registration", headers=headers, data=payload)
-            assert response.status_code == 400
+    payload = json.dumps({"username": "username", "password": password})
+    headers = {"Content-Type": "application/json"}
+    response = test_client.post("api/v1/registration", headers=headers, data=payload)
+    assert response.status_code == 400
 
 
 if __name__ == "__main__":
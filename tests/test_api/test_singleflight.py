@@ -0,0 +1,91 @@
+"""Test coalescing of concurrent lookups."""
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from config import get_settings
+from services.metrics import registry
+from services.singleflight import SingleFlight
+from validators.authentication import get_current_user, principal_cache, principal_lookups
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_call():
+    """Test identical concurrent lookups run once and distinct keys don't wait for each other."""
+    flights = SingleFlight("test-shared")
+    calls = []
+
+    async def lookup(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key * 2
+
+    results = await asyncio.gather(*(flights.do(key, lookup, key) for key in (1, 1, 1, 2)))
+    assert results == [2, 2, 2, 4]
+    assert sorted(calls) == [1, 2]
+    assert flights.stats() == {"calls": 2, "saved": 2, "in_flight": 0}
+
+    assert await flights.do(1, lookup, 1) == 2
+    assert flights.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_and_cancellation():
+    """Test an error reaches every caller and a cancelled caller doesn't cancel the call."""
+    flights = SingleFlight("test-errors")
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise LookupError("gone")
+
+    callers = [asyncio.ensure_future(flights.do("key", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    callers[0].cancel()
+    release.set()
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert [type(result) for result in results[1:]] == [LookupError, LookupError]
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_parallel_requests_with_one_token_query_once(test_session, read_engine, token, event_loop_pools):
+    """Test a burst of requests with an uncached token resolves the principal with a single query."""
+    read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def authenticate():
+        async with read_session() as session:
+            return await get_current_user(token, get_settings(), session)
+
+    principal_cache.clear()
+    saved = principal_lookups.saved
+    event.listen(read_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        users = await asyncio.gather(*(authenticate() for _ in range(5)))
+    finally:
+        event.remove(read_engine.sync_engine, "before_cursor_execute", count)
+    assert {user.username for user in users} == {"testuser1"}
+    assert len([statement for statement in statements if "user_token" in statement]) == 1
+    assert principal_lookups.saved == saved + 4
+    assert 'singleflight_saved_total{group="principal"}' in registry.render()
+
+
+def test_send_item_still_resolves_achiever(test_client, test_session, token):
+    """Test transfer links are created through the coalesced username lookup."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.post("/api/v1/send", headers=headers, json={"item_id": 1, "achiever": "testuser2"})
+    assert response.status_code == 200
+    response = test_client.post("/api/v1/send", headers=headers, json={"item_id": 1, "achiever": "nobody"})
+    assert response.status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main()
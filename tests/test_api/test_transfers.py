@@ -0,0 +1,170 @@
+"""Test pending transfers."""
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import func, select, update
+
+from database.models import PendingTransfer
+from services.transfers import purge_expired_transfers
+
+
+@pytest.fixture(scope="class")
+def token3(test_client, test_session):
+    """Get testuser3 login token."""
+    payload = {"username": "testuser3", "password": "Qwerty123_"}
+    return test_client.post("api/v1/login", data=payload).json()["access_token"]
+
+
+def pending_transfers(session_factory) -> int:
+    async def count():
+        async with session_factory() as session:
+            return (await session.execute(select(func.count(PendingTransfer.id)))).scalar()
+
+    return asyncio.run(count())
+
+
+class TestIncomingTransfers:
+    """Test transfers are listed to their achiever until claimed."""
+
+    @staticmethod
+    def test_offers_are_paged_and_claimed_from_the_listing(test_client, test_session, token, token3):
+        """Test incoming transfers come oldest first with working links, and leave the list once claimed."""
+        headers, headers3 = {"Authorization": f"Bearer {token}"}, {"Authorization": f"Bearer {token3}"}
+        items = [{"title": f"offered-{i}"} for i in range(3)]
+        item_ids = [
+            item["id"] for item in test_client.post("/api/v1/items/bulk", headers=headers, json=items).json()["items"]
+        ]
+        for item_id in item_ids:
+            response = test_client.post(
+                "/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser3"}
+            )
+            assert response.status_code == 200
+
+        page = test_client.get("/api/v1/transfers/incoming?limit=2", headers=headers3).json()
+        assert [transfer["item_id"] for transfer in page["transfers"]] == item_ids[:2]
+        assert page["transfers"][0]["sender"] == "testuser1" and page["transfers"][0]["title"] == "offered-0"
+        assert page["transfers"][0]["expires"] > time.time()
+        page2 = test_client.get(f"/api/v1/transfers/incoming?limit=2&after={page['next_cursor']}", headers=headers3)
+        assert [transfer["item_id"] for transfer in page2.json()["transfers"]] == item_ids[2:]
+        assert page2.json()["next_cursor"] is None
+
+        link = page["transfers"][0]["link"]
+        response = test_client.get(link, headers=headers3)
+        assert response.json() == {"message": "You've just obtained offered-0"}
+        response = test_client.get(link, headers=headers3)
+        assert response.json()["detail"] == "Item offered-0 is already yours"
+        incoming = test_client.get("/api/v1/transfers/incoming", headers=headers3).json()["transfers"]
+        assert [transfer["item_id"] for transfer in incoming] == item_ids[1:]
+
+    @staticmethod
+    def test_sending_again_renews_the_offer(test_client, test_session, token, token3):
+        """Test one item is offered once to one achiever."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.post("/api/v1/items/new", headers=headers, json={"title": "offered-twice"})
+        item_id = response.json()["item"]["id"]
+        before = pending_transfers(test_session)
+        for _ in range(2):
+            test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser3"})
+        assert pending_transfers(test_session) == before + 1
+
+    @staticmethod
+    def test_offer_of_another_user_cannot_be_taken_over(test_client, test_session, token, token3):
+        """Test only the owner of an item can offer it, so an offer can't be overwritten by another user."""
+        headers, headers3 = {"Authorization": f"Bearer {token}"}, {"Authorization": f"Bearer {token3}"}
+        response = test_client.post("/api/v1/items/new", headers=headers, json={"title": "offered-by-owner"})
+        item_id = response.json()["item"]["id"]
+        link = test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser3"})
+
+        token2 = test_client.post("api/v1/login", data={"username": "testuser2", "password": "Qwerty123-"})
+        headers2 = {"Authorization": f"Bearer {token2.json()['access_token']}"}
+        response = test_client.post(
+            "/api/v1/send", headers=headers2, json={"item_id": item_id, "achiever": "testuser3"}
+        )
+        assert response.status_code == 400
+
+        incoming = test_client.get("/api/v1/transfers/incoming", headers=headers3).json()["transfers"]
+        assert [transfer["sender"] for transfer in incoming if transfer["item_id"] == item_id] == ["testuser1"]
+        response = test_client.get(link.json()["link"], headers=headers3)
+        assert response.json() == {"message": "You've just obtained offered-by-owner"}
+
+    @staticmethod
+    def test_claim_voids_other_offers_of_the_item(test_client, test_session, token, token3):
+        """Test an item given to one user leaves the incoming transfers of the others."""
+        headers = {"Authorization": f"Bearer {token}"}
+        response = test_client.post("/api/v1/items/new", headers=headers, json={"title": "offered-to-both"})
+        item_id = response.json()["item"]["id"]
+        test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser3"})
+        link = test_client.post("/api/v1/send", headers=headers, json={"item_id": item_id, "achiever": "testuser2"})
+
+        token2 = test_client.post("api/v1/login", data={"username": "testuser2", "password": "Qwerty123-"})
+        response = test_client.get(
+            link.json()["link"], headers={"Authorization": f"Bearer {token2.json()['access_token']}"}
+        )
+        assert response.status_code == 200
+        incoming = test_client.get("/api/v1/transfers/incoming", headers={"Authorization": f"Bearer {token3}"})
+        assert item_id not in [transfer["item_id"] for transfer in incoming.json()["transfers"]]
+
+    @staticmethod
+    def test_multi_item_link_uses_its_offers(test_client, test_session, token, token3):
+        """Test a multi-item link is listed item by item and can be used once."""
+        headers, headers3 = {"Authorization": f"Bearer {token}"}, {"Authorization": f"Bearer {token3}"}
+        items = [{"title": f"batch-offer-{i}"} for i in range(4)]
+        test_client.post("/api/v1/items/bulk", headers=headers, json=items)
+        link = test_client.post(
+            "/api/v1/send", headers=headers, json={"title_prefix": "batch-offer-", "achiever": "testuser3"}
+        )
+        incoming = test_client.get("/api/v1/transfers/incoming", headers=headers3).json()["transfers"]
+        assert len([transfer for transfer in incoming if transfer["title"].startswith("batch-offer-")]) == 4
+
+        assert len(test_client.get(link.json()["link"], headers=headers3).json()["transferred"]) == 4
+        incoming = test_client.get("/api/v1/transfers/incoming", headers=headers3).json()["transfers"]
+        assert not [transfer for transfer in incoming if transfer["title"].startswith("batch-offer-")]
+
+    @staticmethod
+    def test_deleted_items_take_their_offers_along(test_client, test_session, token, token3):
+        """Test single and bulk deletes remove the pending transfers of the deleted items."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": f"doomed-{i}"} for i in range(4)]
+        item_ids = [
+            item["id"] for item in test_client.post("/api/v1/items/bulk", headers=headers, json=items).json()["items"]
+        ]
+        before = pending_transfers(test_session)
+        test_client.post("/api/v1/send", headers=headers, json={"title_prefix": "doomed-", "achiever": "testuser3"})
+        assert pending_transfers(test_session) == before + 4
+
+        test_client.delete(f"/api/v1/items/:{item_ids[0]}", headers=headers)
+        test_client.delete("/api/v1/items/bulk", headers=headers, json={"item_ids": item_ids[1:2]})
+        test_client.delete("/api/v1/items/bulk", headers=headers, json={"title_pattern": "doomed-%"})
+        assert pending_transfers(test_session) == before
+
+    @staticmethod
+    def test_expired_offers_are_hidden_and_swept(test_client, test_session, token, token3):
+        """Test expired transfers are left out of the listing and purged in batches."""
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [{"title": f"expiring-{i}"} for i in range(5)]
+        test_client.post("/api/v1/items/bulk", headers=headers, json=items)
+        test_client.post("/api/v1/send", headers=headers, json={"title_prefix": "expiring-", "achiever": "testuser3"})
+
+        async def expire():
+            async with test_session() as session:
+                await session.execute(update(PendingTransfer).values(expires=time.time() - 1))
+                await session.commit()
+
+        asyncio.run(expire())
+        incoming = test_client.get("/api/v1/transfers/incoming", headers={"Authorization": f"Bearer {token3}"})
+        assert incoming.json() == {"transfers": [], "next_cursor": None}
+
+        remaining = pending_transfers(test_session)
+        assert remaining >= 5
+        assert asyncio.run(purge_expired_transfers(test_session, batch_size=2)) == remaining
+        assert pending_transfers(test_session) == 0
+
+    @staticmethod
+    def test_incoming_transfers_unauthorized(test_client):
+        """Test the listing needs a token."""
+        assert test_client.get("/api/v1/transfers/incoming").status_code == 401
+
+
+if __name__ == "__main__":
+    pytest.main()
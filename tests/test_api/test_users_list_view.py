@@ -1,38 +1,101 @@
 """Test users_list view."""
-from unittest.mock import patch
+import json
+import sys
 
 from config import get_settings
 import pytest
 
+from views.users_list import prefix_upper_bound
+
 settings = get_settings()
 
 
 def test_get_users_list(test_client, test_session, token):
     """Test users list view sends 200 & users."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.users_list.session", test_session):
-            headers = {"Authorization": f"Bearer {token}"}
-            response = test_client.get("/api/v1/users", headers=headers)
-            assert response.status_code == 200
-            users = response.json()
-            assert users["existing_users"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.get("/api/v1/users", headers=headers)
+    assert response.status_code == 200
+    users = response.json()
+    assert users["existing_users"]
 
 
 def test_not_get_users_list_invalid_token(test_client, test_session, token):
     """Test users list view sends 401 for invalid token."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.users_list.session", test_session):
-            headers = {"Authorization": f"Bearer {token}+a"}
-            response = test_client.get("/api/v1/users", headers=headers)
-            assert response.status_code == 401
+    headers = {"Authorization": f"Bearer {token}+a"}
+    response = test_client.get("/api/v1/users", headers=headers)
+    assert response.status_code == 401
 
 
 def test_not_get_users_list_no_auth(test_client, test_session, token):
     """Test users list view sends 401 without token."""
-    with patch("validators.authentication.session", test_session):
-        with patch("views.users_list.session", test_session):
-            response = test_client.get("/api/v1/users")
-            assert response.status_code == 401
+    response = test_client.get("/api/v1/users")
+    assert response.status_code == 401
+
+
+def test_users_list_etag(test_client, test_session, token):
+    """Test an unchanged users list is answered with 304."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.get("/api/v1/users", headers=headers)
+    etag = response.headers["ETag"]
+
+    response = test_client.get("/api/v1/users", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert not response.content
+    for if_none_match in (f'"other", W/{etag}', "*"):
+        response = test_client.get("/api/v1/users", headers={**headers, "If-None-Match": if_none_match})
+        assert response.status_code == 304
+    response = test_client.get("/api/v1/users", headers={**headers, "If-None-Match": f"{etag}x"})
+    assert response.status_code == 200
+
+
+def test_registration_invalidates_users_list(test_client, test_session, token):
+    """Test a new user shows up in the cached list and changes its ETag."""
+    headers = {"Authorization": f"Bearer {token}"}
+    etag = test_client.get("/api/v1/users", headers=headers).headers["ETag"]
+
+    payload = json.dumps({"username": "cachetestuser", "password": "Qwerty123_"})
+    test_client.post("api/v1/registration", data=payload)
+
+    response = test_client.get("/api/v1/users", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "cachetestuser" in response.json()["existing_users"]
+
+
+def test_users_list_by_pages(test_client, test_session, token):
+    """Test users are paged through with a keyset cursor."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.get("/api/v1/users?prefix=testuser&limit=2", headers=headers).json()
+    assert response == {"existing_users": ["testuser1", "testuser2"], "next_cursor": "testuser2"}
+
+    response = test_client.get("/api/v1/users?prefix=testuser&limit=2&after=testuser2", headers=headers).json()
+    assert response == {"existing_users": ["testuser3"], "next_cursor": None}
+
+
+@pytest.mark.parametrize(("prefix", "users"), [("testuser3", ["testuser3"]), ("tester", []), ("u", [])])
+def test_users_list_prefix(test_client, test_session, token, prefix, users):
+    """Test prefix filter."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.get(f"/api/v1/users?prefix={prefix}", headers=headers)
+    assert response.json()["existing_users"] == users
+
+
+@pytest.mark.parametrize("prefix", ["%F4%8F%BF%BF", "t%F4%8F%BF%BF%F4%8F%BF%BF", "%ED%9F%BF"])
+def test_users_list_prefix_at_highest_code_points(test_client, test_session, token, prefix):
+    """Test prefixes ending in a character that can't be incremented as is are served."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.get(f"/api/v1/users?prefix={prefix}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["existing_users"] == []
+
+
+def test_prefix_upper_bound():
+    """Test the bound carries over the highest code point and skips surrogates."""
+    top = chr(sys.maxunicode)
+    assert prefix_upper_bound("ab") == "ac"
+    assert prefix_upper_bound("a" + top + top) == "b"
+    assert prefix_upper_bound(top) is None
+    assert prefix_upper_bound("\ud7ff") == "\ue000"
 
 
 if __name__ == "__main__":
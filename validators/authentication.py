@@ -1,23 +1,61 @@
 """Users' authentication."""
+import hashlib
+
 import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt import PyJWTError
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from config import Settings, get_settings
-from database.engine import session
+from database.engine import async_read_session, get_read_session
 from database.models import User, UserToken
+from database.schemas import CurrentUser
+from services.cache import TTLCache
+from services.hashing import hash_pool
+from services.invalidation import bus
+from services.singleflight import SingleFlight
+from services.tokens import TokenGenerations
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
+principal_cache = TTLCache(get_settings().PRINCIPAL_CACHE_SIZE, get_settings().PRINCIPAL_CACHE_TTL, name="principal")
+token_generations = TokenGenerations(name="token_generations")
+principal_lookups = SingleFlight("principal")
+
+
+def token_digest(token: str) -> str:
+    """Key of the token in the principal cache and in invalidation events, which never hold tokens."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_event(user_id: int, generation: int, revoked_token: str = None) -> str:
+    """Key of the "token" invalidation event published by a login."""
+    return f"{user_id}:{generation}:{token_digest(revoked_token) if revoked_token else ''}"
+
+
+def forget_revoked_token(key: str):
+    """Apply a login served by another worker to the caches of this one."""
+    user_id, generation, revoked_digest = key.split(":", 2)
+    if revoked_digest:
+        principal_cache.pop(revoked_digest)
+    if int(generation):
+        token_generations.set(int(user_id), int(generation))
 
-async def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends()):
+
+bus.subscribe("token", forget_revoked_token)
+
+
+async def authenticate_user(
+    form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_read_session)
+):
     """Check user's credentials received in headers.
 
     :return database user entry
     :raise HTTP_401_UNAUTHORIZED
+    :raise HashPoolBusy: the password can't be verified right now
     """
     if not form_data.username or not form_data.password:
         raise HTTPException(
@@ -26,9 +64,8 @@ async def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "OAuth2 Bearer"},
         )
 
-    async with session:
-        query = select(User).where(User.username == form_data.username)
-        result = await session.execute(query)
+    query = select(User).where(User.username == form_data.username)
+    result = await session.execute(query)
     user: User = result.scalars().first()
 
     if not user:
@@ -38,7 +75,9 @@ async def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "OAuth2 Bearer"},
         )
 
-    if not user.verify_password(form_data.password):
+    # Give the connection back to the pool for the duration of the slow password check
+    await session.close()
+    if not await hash_pool.verify(form_data.password, user.password):
         raise HTTPException(
             status_code=401, detail="Unauthorized: Wrong password", headers={"WWW-Authenticate": "Basic"}
         )
@@ -46,10 +85,22 @@ async def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends()):
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), settings: Settings = Depends(get_settings)):
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
     """Validate user's token.
 
-    :return database user entry
+    Principals are cached by token; the token signature and expiry are still checked on every call.
+    A cache miss resolves the user and their current token in one joined query,
+    shared by the concurrent requests with the same token.
+
+    With STATELESS_TOKENS a token of the user's current generation is accepted, and one of an older
+    generation rejected, without any database access. Only tokens of unknown users or of a newer
+    generation (issued by another worker) are looked up.
+
+    :return authenticated user
     :raise HTTP_401_UNAUTHORIZED
     """
     credentials_exception = HTTPException(
@@ -69,22 +120,51 @@ async def get_current_user(token: str = Depends(oauth2_scheme), settings: Settin
             headers={"WWW-Authenticate": "OAuth2 Bearer"},
         )
 
-    async with session:
-        query = select(User).where(User.id == user_id)
-        result = await session.execute(query)
-    user = result.scalars().first()
-    if not user:
-        raise credentials_exception
+    generation = payload.get("gen")
+    stateless = settings.STATELESS_TOKENS and generation and payload.get("name")
+    if stateless:
+        current = token_generations.check(user_id, generation)
+        if current:
+            return CurrentUser(id=user_id, username=payload["name"])
+        if current is False:
+            raise credentials_exception
 
-    async with session:
-        query = select(UserToken.token).where(UserToken.user_id == user_id)
-        result = await session.execute(query)
-    user_token = result.scalars().first()
-    if not user_token or user_token != token:
+    digest = token_digest(token)
+    user = principal_cache.get(digest)
+    if user:
+        return user
+
+    version, row = await principal_lookups.do(token, lookup_principal, session, user_id, token)
+    if not row:
         raise credentials_exception
+    user = CurrentUser(id=row.id, username=row.username)
+    principal_cache.set(digest, user, version)
+    if stateless:
+        token_generations.set(user_id, generation)
     return user
 
 
+async def lookup_principal(session: AsyncSession, user_id: int, token: str):
+    """Cache version read before the lookup, and the principal found by `find_principal`.
+
+    The version is taken by the call shared through single-flight, so requests joining it late
+    can't cache a row read before a login revoked the token.
+    """
+    version = principal_cache.version
+    return version, await find_principal(session, user_id, token)
+
+
+async def find_principal(session: AsyncSession, user_id: int, token: str):
+    """Id and username of the user whose current token it is, or None."""
+    query = (
+        select(User.id, User.username)
+        .join(UserToken, UserToken.user_id == User.id)
+        .where(User.id == user_id, UserToken.token == token)
+    )
+    result = await session.execute(query)
+    return result.first()
+
+
 def decode_token(token, key):
     """Decode token."""
     try:
@@ -92,3 +172,23 @@ def decode_token(token, key):
         return payload
     except PyJWTError as e:
         raise HTTPException(status_code=401, detail=e.args[0])
+
+
+def token_generation(token: str, key: str) -> int:
+    """Generation of a token issued by this app, expired or not; 0 for tokens without one."""
+    try:
+        return jwt.decode(token, key, algorithms=["HS256"], options={"verify_exp": False}).get("gen", 0)
+    except PyJWTError:
+        return 0
+
+
+async def load_token_generations():
+    """Fill token generations from the stored tokens of all users."""
+    key = get_settings().SECRET_KEY
+    async with async_read_session() as session:
+        result = await session.stream(select(UserToken.user_id, UserToken.token))
+        async for rows in result.partitions(10000):
+            for user_id, token in rows:
+                generation = token_generation(token, key)
+                if generation:
+                    token_generations.set(user_id, generation)
@@ -2,11 +2,6 @@
 
 import re
 
-from sqlalchemy import select
-
-from database.engine import session
-from database.models import User
-
 __all__ = ["ValidationError", "validate"]
 
 
@@ -17,28 +12,18 @@ class ValidationError(Exception):
 
 
 async def __validate(credentials):
-    """Starts validation."""
-    username = credentials.username
+    """Starts validation.
+
+    Username uniqueness is enforced by the database on insert.
+    """
     password = credentials.password
     try:
-        await __validate_username(username)
         await __validate_password(password)
         return True
     except ValueError as e:
         raise ValidationError(e.args[0])
 
 
-async def __validate_username(username):
-    """Validates username is unique."""
-    async with session:
-        query = select(User.id).where(User.username == username)
-        result = await session.execute(query)
-    user = result.scalars().first()
-    if user:
-        raise ValueError(f"Username '{username}' has been already registered by another user")
-    return True
-
-
 async def __validate_password(password):
     """Validates password."""
     try:
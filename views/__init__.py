@@ -1,6 +1,18 @@
-__all__ = ["login_router", "users_list_router", "reg_router", "items_router", "exchange_router"]
+__all__ = [
+    "login_router",
+    "users_list_router",
+    "reg_router",
+    "items_router",
+    "exchange_router",
+    "metrics_router",
+    "transfers_router",
+    "events_router",
+]
 
+from .events import router as events_router
 from .items import items_router, exchange_router
 from .login import router as login_router
+from .metrics import router as metrics_router
 from .registration import router as reg_router
+from .transfers import router as transfers_router
 from .users_list import router as users_list_router
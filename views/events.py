@@ -0,0 +1,105 @@
+"""Views pushing item events to the user: server-sent events and WebSocket."""
+import asyncio
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from config import Settings, get_settings
+from database.engine import get_read_session
+from database.schemas import CurrentUser
+from services.events import OVERFLOW, hub
+from validators.authentication import get_current_user
+
+router = APIRouter(tags=["events"])
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def event_stream(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Stream the user's item events as server-sent events.
+
+    Events are item.created, item.deleted, item.transferred and transfer.offered, with the
+    event type as the SSE event name and JSON data. An idle stream gets a comment every
+    EVENTS_HEARTBEAT seconds. After an overflow event some events were lost and the stream
+    ends: reload the items before reconnecting.
+    """
+    # The stream outlives the request: give the connection used for authentication back now
+    await session.close()
+    return StreamingResponse(
+        server_sent_events(current_user.id, request.is_disconnected, settings.EVENTS_HEARTBEAT),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def server_sent_events(user_id: int, is_disconnected, heartbeat: float):
+    """Yield the events of the user in the SSE format until the client is gone.
+
+    The subscription is made once the stream starts: a response never sent never subscribes.
+    """
+    subscription = hub.subscribe(user_id)
+    try:
+        while not await is_disconnected():
+            item = await subscription.get(heartbeat)
+            if item is None:
+                yield b": ping\n\n"
+                continue
+            yield b"event: " + item["type"].encode() + b"\ndata: " + orjson.dumps(item) + b"\n\n"
+            if item is OVERFLOW:
+                return
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.websocket("/events/ws")
+async def event_socket(
+    websocket: WebSocket,
+    token: str = Query(None),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Send the user's item events as JSON text messages.
+
+    The access token goes in the Authorization header or, for browsers, the `token` query parameter.
+    Messages from the client are ignored.
+    """
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    token = credentials if scheme.lower() == "bearer" else token
+    try:
+        current_user = await get_current_user(token, settings, session)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        await session.close()
+
+    await websocket.accept()
+    subscription = hub.subscribe(current_user.id)
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.get(settings.EVENTS_HEARTBEAT))
+            await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+            elif getter.result() is not None:
+                await websocket.send_text(orjson.dumps(getter.result()).decode())
+                if getter.result() is OVERFLOW:
+                    await websocket.close()
+                    return
+            if receiver.done():
+                if receiver.result()["type"] == "websocket.disconnect":
+                    return
+                receiver = asyncio.ensure_future(websocket.receive())
+    finally:
+        receiver.cancel()
+        hub.unsubscribe(subscription)
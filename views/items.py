@@ -1,95 +1,406 @@
 """Views for items handling."""
+import base64
+import time
+import zlib
+from typing import List, Union
+
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from jwt import PyJWTError
-from sqlalchemy import select
+from pydantic import ValidationError, parse_obj_as
+from pydantic.error_wrappers import ErrorWrapper
+from sqlalchemy import Integer, and_, column, delete, insert, literal, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import Settings, get_settings
-from database.schemas import ItemData, TransferData
-from database.engine import session
-from database.models import Item, User
+from database.schemas import (
+    BulkDeleteData,
+    BulkDeleted,
+    BulkResult,
+    CurrentUser,
+    ItemCreated,
+    ItemData,
+    ItemsPage,
+    Message,
+    TransferData,
+    TransferLink,
+    TransferResult,
+)
+from database.engine import get_read_session, get_session
+from database.models import Item, ItemVersion, PendingTransfer, User
+from services.cache import etag_matches
+from services.events import emit, item_event
+from services.singleflight import SingleFlight
 from validators.authentication import decode_token, get_current_user
 
 items_router = APIRouter(prefix="/items", tags=["items"])
 exchange_router = APIRouter(tags=["items_exchange"])
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+user_id_lookups = SingleFlight("user_id")
 
-@items_router.get("/")
-async def get_items(current_user: User = Depends(get_current_user)):
-    """Get item and attach it to creator."""
+
+@items_router.get("/", response_model=ItemsPage)
+async def get_items(
+    request: Request,
+    limit: int = Query(None, ge=1, le=get_settings().ITEMS_PAGE_SIZE_MAX),
+    after: int = Query(None, ge=0),
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Get user's items ordered by id, one page at a time.
+
+    Pass `next_cursor` of a page as `after` to get the next one; it is null on the last page.
+    With `Accept: application/x-ndjson` all the items after the cursor (up to `limit`, if given)
+    are streamed as one JSON object per line.
+    Pages are serialized straight from the rows, bypassing response model validation.
+    Responses carry an ETag made of the version of the user's items: with it in `If-None-Match`
+    an unchanged list is answered 304 from the version alone, without reading the items.
+    """
     if current_user:
-        async with session:
-            query = select(Item.id, Item.title).where(Item.user_id == current_user.id)
-            result = await session.execute(query)
-        items = result.fetchall()
-        return {current_user.username: items}
+        ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+        # Read before the items: a change committed in between leaves the ETag behind the list, never ahead
+        version = await item_version(session, current_user.id)
+        etag = f'"{current_user.id}-{version}{"-ndjson" if ndjson else ""}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept, Authorization"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        query = select(Item.id, Item.title).where(Item.user_id == current_user.id).order_by(Item.id)
+        if after is not None:
+            query = query.where(Item.id > after)
+
+        if ndjson:
+            if limit:
+                query = query.limit(limit)
+            return StreamingResponse(
+                stream_items(session, query, settings.ITEMS_STREAM_CHUNK),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers=headers,
+            )
+
+        limit = limit or settings.ITEMS_PAGE_SIZE
+        result = await session.execute(query.limit(limit + 1))
+        rows = result.fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        items = [{"id": id_, "title": title} for id_, title in rows[:limit]]
+        return ORJSONResponse({current_user.username: items, "next_cursor": next_cursor}, headers=headers)
+
+
+async def item_version(session: AsyncSession, user_id: int) -> int:
+    result = await session.execute(select(ItemVersion.version).where(ItemVersion.user_id == user_id))
+    return result.scalar() or 0
+
 
+async def bump_item_versions(session: AsyncSession, user_ids: List[int]):
+    """Move the item lists of the users to a new version, in the transaction changing them."""
+    query = sqlite_insert(ItemVersion)
+    query = query.on_conflict_do_update(index_elements=[ItemVersion.user_id], set_={"version": ItemVersion.version + 1})
+    await session.execute(query, [{"user_id": user_id, "version": 1} for user_id in sorted(set(user_ids))])
 
-@items_router.post("/new", status_code=201)
-async def create_new_item(item: ItemData, current_user: User = Depends(get_current_user)):
+
+async def stream_items(session: AsyncSession, query, chunk_size: int):
+    """Yield items as NDJSON lines, fetching `chunk_size` rows from the cursor at a time."""
+    result = await session.stream(query)
+    async for rows in result.partitions(chunk_size):
+        yield b"".join(orjson.dumps({"id": id_, "title": title}) + b"\n" for id_, title in rows)
+
+
+@items_router.post("/new", status_code=201, response_model=ItemCreated)
+async def create_new_item(
+    item: ItemData, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_session)
+):
     """Create new item and attach it to creator.
 
     If many items were passed only the last one will be promoted.
+    A single INSERT: duplicates are caught by the unique title index and the new id
+    comes back with the statement's result.
     """
-    async with session:
-        query = select(Item).where(Item.title == item.title)
-        result = await session.execute(query)
-        if result.scalars().first():
+    if current_user:
+        try:
+            result = await session.execute(insert(Item).values(title=item.title, user_id=current_user.id))
+            item_id = result.inserted_primary_key[0]
+            await bump_item_versions(session, [current_user.id])
+            emit(session, [current_user.id], item_event("item.created", [{"id": item_id, "title": item.title}]))
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
             raise HTTPException(status_code=400, detail=f"{item.title} has been already stored")
+        return {
+            "message": "Item was successfully created",
+            "item": {"id": item_id, "title": item.title, "username": current_user.username},
+        }
 
+
+@items_router.post("/bulk", status_code=201, response_model=BulkResult)
+async def create_items_bulk(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_session),
+):
+    """Create many items at once and attach them to creator.
+
+    Accepts a JSON array of items or, with `Content-Type: application/x-ndjson`, one item per line.
+    Items are inserted with multi-row INSERTs in one transaction; titles that are already stored
+    (or repeated in the request) are reported as duplicates instead of failing the whole request.
+    """
     if current_user:
-        new_item = Item(title=item.title, user_id=current_user.id)
-        async with session:
-            session.add(new_item)
-            await session.commit()
-            query = (
-                select(Item.id, Item.title, User.username)
-                .where(Item.title == item.title)
-                .join(User, User.id == current_user.id)
-            )
-            result = await session.execute(query)
-        item = result.first()
-        return {"message": "Item was successfully created", "item": item}
+        items = await parse_bulk_items(request, settings.BULK_MAX_ITEMS)
+        results = []
+        for start in range(0, len(items), settings.BULK_BATCH_SIZE):
+            end = start + settings.BULK_BATCH_SIZE
+            results.extend(await insert_items_batch(session, items[start:end], current_user.id))
+        new_items = [
+            {"id": result["id"], "title": result["title"]} for result in results if result["status"] == "created"
+        ]
+        if new_items:
+            await bump_item_versions(session, [current_user.id])
+            emit(session, [current_user.id], item_event("item.created", new_items))
+        await session.commit()
+
+        created = len(new_items)
+        content = {"created": created, "duplicates": len(results) - created, "items": results}
+        return ORJSONResponse(content, status_code=201)
+
+
+async def parse_bulk_items(request: Request, max_items: int) -> List[ItemData]:
+    """Validate the whole payload before anything is written.
+
+    The body is read to the end first, so no write transaction is left open
+    while waiting for a slow client.
+    """
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        items, buffer, line_number = [], b"", 0
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    items.append(parse_ndjson_item(line, line_number))
+            if len(items) > max_items:
+                break
+        if buffer.strip():
+            items.append(parse_ndjson_item(buffer, line_number + 1))
+    else:
+        try:
+            items = parse_obj_as(List[ItemData], await request.json())
+        except ValueError as e:
+            raise RequestValidationError([ErrorWrapper(e, ("body",))])
+
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"No more than {max_items} items per request")
+    return items
 
 
-@items_router.delete("/:{item_id}", status_code=200)  # Actually it should return 204, but we need to return a message
-async def delete_item(item_id: int, current_user: User = Depends(get_current_user)):
-    """Delete an item by its id."""
+def parse_ndjson_item(line: bytes, line_number: int) -> ItemData:
+    try:
+        return ItemData.parse_raw(line)
+    except ValidationError as e:
+        raise RequestValidationError([ErrorWrapper(e, ("body", line_number))])
+
+
+async def insert_items_batch(session: AsyncSession, batch: List[ItemData], user_id: int) -> List[dict]:
+    """Insert one batch with three statements regardless of its size.
+
+    :return per-item status in the order of the batch
+    """
+    titles = list(dict.fromkeys(item.title for item in batch))
+    result = await session.execute(select(Item.title).where(Item.title.in_(titles)))
+    stored = set(result.scalars().fetchall())
+    new_titles = [title for title in titles if title not in stored]
+
+    created = {}
+    if new_titles:
+        # OR IGNORE: a title stored concurrently since the check is reported as a duplicate
+        query = insert(Item).prefix_with("OR IGNORE", dialect="sqlite")
+        await session.execute(query.values([{"title": title, "user_id": user_id} for title in new_titles]))
+        query = select(Item.id, Item.title).where(Item.title.in_(new_titles), Item.user_id == user_id)
+        result = await session.execute(query)
+        created = {row.title: row.id for row in result}
+
+    results = []
+    for item in batch:
+        item_id = created.pop(item.title, None)
+        if item_id:
+            results.append({"id": item_id, "title": item.title, "status": "created"})
+        else:
+            results.append({"title": item.title, "status": "duplicate"})
+    return results
+
+
+@items_router.delete(
+    "/:{item_id}", status_code=200, response_model=Message
+)  # Actually it should return 204, but we need to return a message
+async def delete_item(
+    item_id: int, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_session)
+):
+    """Delete an item of the user by its id.
+
+    One conditional DELETE: an item of another user is reported as missing.
+    """
     if current_user:
-        async with session:
-            query = select(Item).where(Item.id == item_id)
-            result = await session.execute(query)
-            item: Item = result.scalars().first()
-            if item:
-                session.delete(item)
-                await session.commit()
-                return {"message": f"Item {item.title} was successfully deleted"}
-            raise HTTPException(status_code=404, detail=f"No item with id {item_id}")
-
-
-@exchange_router.post("/send")
+        deleted = await delete_items(session, and_(Item.id == item_id, Item.user_id == current_user.id))
+        if deleted:
+            await bump_item_versions(session, [current_user.id])
+            emit(session, [current_user.id], item_event("item.deleted", [{"id": item_id}]))
+        await session.commit()
+        if deleted:
+            return {"message": f"Item {item_id} was successfully deleted"}
+        raise HTTPException(status_code=404, detail=f"No item with id {item_id}")
+
+
+@items_router.delete("/bulk", response_model=BulkDeleted)
+async def delete_items_bulk(
+    data: BulkDeleteData,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_session),
+):
+    """Delete many items of the user at once, by ids or by a LIKE pattern of their titles.
+
+    Ids are deleted BULK_BATCH_SIZE at a time, all in one transaction; ids of missing
+    items or of other users' items are ignored.
+    """
+    if current_user:
+        owned = Item.user_id == current_user.id
+        deleted = 0
+        if data.item_ids is not None:
+            if len(data.item_ids) > settings.BULK_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"No more than {settings.BULK_MAX_ITEMS} items per request")
+            item_ids = list(dict.fromkeys(data.item_ids))
+            for start in range(0, len(item_ids), settings.BULK_BATCH_SIZE):
+                end = start + settings.BULK_BATCH_SIZE
+                deleted += await delete_items(session, and_(owned, Item.id.in_(item_ids[start:end])))
+        else:
+            deleted = await delete_items(session, and_(owned, Item.title.like(data.title_pattern)))
+        if deleted:
+            await bump_item_versions(session, [current_user.id])
+            # Which of the ids were deleted is unknown: clients reload their items
+            emit(session, [current_user.id], item_event("item.deleted", count=deleted))
+        await session.commit()
+        return {"deleted": deleted}
+
+
+async def delete_items(session: AsyncSession, condition) -> int:
+    """Delete the items matching the condition along with their pending transfers.
+
+    Item ids get reused, so an offer left behind would hand over the next item to take the id.
+
+    :return number of items deleted
+    """
+    offers = delete(PendingTransfer).where(PendingTransfer.item_id.in_(select(Item.id).where(condition)))
+    await session.execute(offers.execution_options(synchronize_session=False))
+    result = await session.execute(delete(Item).where(condition).execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+@exchange_router.post("/send", response_model=TransferLink)
 async def send_item(
-    data: TransferData, current_user: User = Depends(get_current_user), settings: Settings = Depends(get_settings)
+    data: TransferData,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    read_session: AsyncSession = Depends(get_read_session),
+    session: AsyncSession = Depends(get_session),
 ):
-    """Create a link and a token for transfer an item to a certain user."""
-    async with session:
-        query = select(User.id).where(User.username == data.achiever)
-        result = await session.execute(query)
-        user = result.scalars().first()
-        query = select(Item.id).where(Item.id == data.item_id)
-        result = await session.execute(query)
-        item_ = result.scalars().first()
-    if user and user != current_user.id and item_:
-        token = generate_exchange_token(current_user.id, user, data.item_id, settings.SECRET_KEY)
-        return {"link": f"/api/v1/get?transfer_key={token}"}
-    raise HTTPException(status_code=400, detail="Invalid data in request payload")
+    """Offer an item to a certain user and return the link to claim it.
+
+    The offer is stored as a pending transfer, listed in the achiever's incoming transfers
+    until it is claimed or expires. Sending the item to the same user again renews it.
+    With `item_ids` or `title_prefix` one link covers all the matching items of the sender.
+    """
+    achiever = await user_id_lookups.do(data.achiever, find_user_id, read_session, data.achiever)
+    if not achiever or achiever == current_user.id:
+        raise HTTPException(status_code=400, detail="Invalid data in request payload")
+    item_ids = await items_to_send(read_session, data, current_user.id, settings.BULK_MAX_ITEMS)
+    if not item_ids:
+        raise HTTPException(status_code=400, detail="Invalid data in request payload")
+
+    expires = time.time() + settings.TRANSFER_TTL
+    if not await offer_items(session, item_ids, current_user.id, achiever, expires):
+        # The items changed hands since they were looked up
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Invalid data in request payload")
+    items = [{"id": item_id} for item_id in item_ids]
+    offered = item_event("transfer.offered", items, sender_id=current_user.id, sender=current_user.username)
+    emit(session, [achiever], offered)
+    if data.item_id is None:
+        await session.commit()
+        token = generate_transfer_token(current_user.id, achiever, item_ids, settings.SECRET_KEY, expires)
+        return {"link": f"/api/v1/get?transfer_key={token}", "items": len(item_ids)}
+
+    query = select(PendingTransfer.id).where(
+        PendingTransfer.item_id == data.item_id, PendingTransfer.achiever_id == achiever
+    )
+    transfer_id = (await session.execute(query)).scalar()
+    await session.commit()
+    token = generate_exchange_token(current_user.id, achiever, data.item_id, settings.SECRET_KEY, transfer_id, expires)
+    return {"link": f"/api/v1/get?transfer_key={token}"}
+
+
+async def items_to_send(session: AsyncSession, data: TransferData, owner: int, max_items: int) -> List[int]:
+    """Ids of the requested items the sender owns."""
+    query = select(Item.id).where(Item.user_id == owner).order_by(Item.id)
+    if data.item_id is not None:
+        query = query.where(Item.id == data.item_id)
+    elif data.item_ids is not None:
+        query = query.where(Item.id.in_(id_set(data.item_ids)))
+    else:
+        query = query.where(Item.title.startswith(data.title_prefix, autoescape=True))
+    result = await session.execute(query.limit(max_items + 1))
+    item_ids = result.scalars().all()
+    if len(item_ids) > max_items:
+        raise HTTPException(status_code=413, detail=f"No more than {max_items} items per transfer")
+    return item_ids
+
+
+async def offer_items(session: AsyncSession, item_ids: List[int], owner: int, achiever: int, expires: float) -> int:
+    """Store or renew the pending transfers of the items the owner still has.
+
+    Ownership is checked by the INSERT itself, so nobody can offer, or take over the offer of,
+    an item of another user.
+
+    :return number of offers stored
+    """
+    offered = select(Item.id, literal(owner), literal(achiever), literal(expires)).where(
+        Item.id.in_(id_set(item_ids)), Item.user_id == owner
+    )
+    columns = ["item_id", "owner_id", "achiever_id", "expires"]
+    query = sqlite_insert(PendingTransfer).from_select(columns, offered)
+    query = query.on_conflict_do_update(
+        index_elements=[PendingTransfer.item_id, PendingTransfer.achiever_id],
+        set_={"owner_id": query.excluded.owner_id, "expires": query.excluded.expires},
+    )
+    result = await session.execute(query)
+    return result.rowcount
+
+
+async def find_user_id(session: AsyncSession, username: str):
+    result = await session.execute(select(User.id).where(User.username == username))
+    return result.scalars().first()
 
 
-@exchange_router.get("/get")
+@exchange_router.get("/get", response_model=Union[Message, TransferResult])
 async def get_item_by_achiever(
-    transfer_key: str = None, current_user: User = Depends(get_current_user), settings: Settings = Depends(get_settings)
+    transfer_key: str = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_session),
 ):
-    """Obtain an item by the user encoded in the link-token."""
+    """Obtain an item by the user encoded in the link-token.
+
+    The claim is one conditional UPDATE that only matches while the item still belongs
+    to the sender, so of many concurrent claims exactly one wins.
+    A multi-item link moves all its items still owned by the sender at once and reports
+    the ids transferred and skipped.
+    """
     if not transfer_key:
         raise HTTPException(status_code=404)
 
@@ -101,19 +412,144 @@ async def get_item_by_achiever(
     if transfer_data["achiever_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Sorry, this link isn't for you")
 
-    async with session:
-        query = select(Item).where(Item.id == transfer_data["item_id"])
+    if "items" in transfer_data:
+        return await claim_items(session, transfer_data, current_user.id)
+
+    item_id = transfer_data["item_id"]
+    transfer_id = transfer_data.get("transfer_id")
+    claimed = False
+    if transfer_id is None or await use_transfer(session, transfer_id, current_user.id):
+        query = (
+            update(Item)
+            .where(Item.id == item_id, Item.user_id == transfer_data["owner_id"])
+            .values(user_id=current_user.id)
+            .execution_options(synchronize_session=False)
+        )
         result = await session.execute(query)
-        item: Item = result.scalars().first()
-        if item.user_id == current_user.id:
-            raise HTTPException(status_code=400, detail=f"Item {item.title} is already yours")
-        if item.user_id != transfer_data["owner_id"]:
-            raise HTTPException(status_code=400, detail=f"Item {item.title} was already passed to another user")
-        item.user_id = transfer_data["achiever_id"]
-        await session.commit()
+        claimed = result.rowcount == 1
+        if claimed:
+            # Offers of the item made by its former owner are void now
+            query = delete(PendingTransfer).where(PendingTransfer.item_id == item_id)
+            await session.execute(query.execution_options(synchronize_session=False))
+            owner = transfer_data["owner_id"]
+            await bump_item_versions(session, [owner, current_user.id])
+            moved = item_event("item.transferred", [{"id": item_id}], sender_id=owner, achiever_id=current_user.id)
+            emit(session, [owner, current_user.id], moved)
+    # Read in the transaction: after commit the writer connection is free for other requests
+    query = select(Item.title, Item.user_id).where(Item.id == item_id)
+    result = await session.execute(query)
+    item = result.first()
+    await session.commit()
+
+    if not item:
+        raise HTTPException(status_code=404, detail=f"No item with id {item_id}")
+    if claimed:
         return {"message": f"You've just obtained {item.title}"}
+    if item.user_id == current_user.id:
+        raise HTTPException(status_code=400, detail=f"Item {item.title} is already yours")
+    if item.user_id == transfer_data["owner_id"]:
+        raise HTTPException(status_code=400, detail="This link has already been used or has expired")
+    raise HTTPException(status_code=400, detail=f"Item {item.title} was already passed to another user")
+
+
+async def use_transfer(session: AsyncSession, transfer_id: int, achiever: int) -> bool:
+    """Delete the pending transfer unless it is gone or expired: every transfer is used once."""
+    query = delete(PendingTransfer).where(
+        PendingTransfer.id == transfer_id,
+        PendingTransfer.achiever_id == achiever,
+        PendingTransfer.expires > time.time(),
+    )
+    result = await session.execute(query.execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def generate_exchange_token(
+    owner: int, achiever: int, item_id: int, key: str, transfer_id: int = None, expires: float = None
+):
+    """Generate token for item transfer, expiring with its pending transfer."""
+    claims = {"owner_id": owner, "achiever_id": achiever, "item_id": item_id}
+    if transfer_id is not None:
+        claims.update(transfer_id=transfer_id, exp=int(expires))
+    return jwt.encode(claims, key)
+
+
+async def claim_items(session: AsyncSession, transfer_data: dict, achiever: int) -> ORJSONResponse:
+    """Reassign the items of a multi-item link still offered and owned by the sender with one UPDATE.
+
+    The pending transfers of the link are used up, whether their items moved or not.
+    """
+    item_ids = unpack_ids(transfer_data["items"])
+    offers = and_(
+        PendingTransfer.achiever_id == achiever,
+        PendingTransfer.owner_id == transfer_data["owner_id"],
+        PendingTransfer.item_id.in_(id_set(item_ids)),
+    )
+    offered = select(PendingTransfer.item_id).where(offers, PendingTransfer.expires > time.time())
+    owned = and_(Item.user_id == transfer_data["owner_id"], Item.id.in_(offered))
+    # All statements run in the write transaction, so the UPDATE moves exactly the selected items
+    result = await session.execute(select(Item.id).where(owned).order_by(Item.id))
+    transferred = result.scalars().all()
+    if transferred:
+        query = update(Item).where(owned).values(user_id=achiever).execution_options(synchronize_session=False)
+        await session.execute(query)
+        query = delete(PendingTransfer).where(PendingTransfer.item_id.in_(id_set(transferred)))
+        await session.execute(query.execution_options(synchronize_session=False))
+        owner = transfer_data["owner_id"]
+        await bump_item_versions(session, [owner, achiever])
+        items = [{"id": item_id} for item_id in transferred]
+        emit(session, [owner, achiever], item_event("item.transferred", items, sender_id=owner, achiever_id=achiever))
+    await session.execute(delete(PendingTransfer).where(offers).execution_options(synchronize_session=False))
+    await session.commit()
+
+    moved = set(transferred)
+    skipped = [item_id for item_id in item_ids if item_id not in moved]
+    message = f"You've just obtained {len(transferred)} of {len(item_ids)} items"
+    return ORJSONResponse({"message": message, "transferred": transferred, "skipped": skipped})
+
+
+def generate_transfer_token(owner: int, achiever: int, item_ids: List[int], key: str, expires: float):
+    """Generate token for a multi-item transfer."""
+    claims = {"owner_id": owner, "achiever_id": achiever, "items": pack_ids(item_ids), "exp": int(expires)}
+    return jwt.encode(claims, key)
+
+
+def id_set(item_ids: List[int]):
+    """Subquery of the ids, bound as one JSON array parameter whatever their number."""
+    query = text("SELECT value FROM json_each(:item_ids)").bindparams(item_ids=orjson.dumps(item_ids).decode())
+    return query.columns(column("value", Integer))
+
+
+def pack_ids(item_ids: List[int]) -> str:
+    """Compact text form of a set of ids.
+
+    Runs of consecutive ids are written as their distance from the end of the previous run
+    and their length; the text is deflated and base64url-encoded.
+    """
+    runs, previous = [], 0
+    for start, end in id_runs(sorted(set(item_ids))):
+        runs.append(f"{start - previous}+{end - start}" if end > start else str(start - previous))
+        previous = end
+    return base64.urlsafe_b64encode(zlib.compress(",".join(runs).encode(), 9)).rstrip(b"=").decode()
+
+
+def unpack_ids(packed: str) -> List[int]:
+    """Ids packed by `pack_ids`, sorted."""
+    runs = zlib.decompress(base64.urlsafe_b64decode(packed + "=" * (-len(packed) % 4))).decode()
+    item_ids, previous = [], 0
+    for run in filter(None, runs.split(",")):
+        offset, _, length = run.partition("+")
+        start = previous + int(offset)
+        previous = start + int(length or 0)
+        item_ids.extend(range(start, previous + 1))
+    return item_ids
 
 
-def generate_exchange_token(owner: int, achiever: int, item_id: int, key: str):
-    """Generate token for item transfer."""
-    return jwt.encode({"owner_id": owner, "achiever_id": achiever, "item_id": item_id}, key)
+def id_runs(item_ids: List[int]) -> List[list]:
+    """First and last id of every run of consecutive ids in sorted ids."""
+    runs = []
+    for item_id in item_ids:
+        if runs and item_id == runs[-1][1] + 1:
+            runs[-1][1] = item_id
+        else:
+            runs.append([item_id, item_id])
+    return runs
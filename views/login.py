@@ -4,39 +4,70 @@ import datetime
 import jwt
 import jwt.exceptions
 from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import Settings, get_settings
-from database.engine import session
+from database.engine import get_session
 from database.models import User, UserToken
-from validators.authentication import authenticate_user
+from database.schemas import Token
+from services.invalidation import bus
+from validators.authentication import (
+    authenticate_user,
+    principal_cache,
+    token_digest,
+    token_event,
+    token_generation,
+    token_generations,
+)
 
 router = APIRouter(tags=["login"])
 
 
-@router.post("/login")
-async def login(current_user: User = Depends(authenticate_user), settings: Settings = Depends(get_settings)):
+@router.post("/login", response_model=Token)
+async def login(
+    current_user: User = Depends(authenticate_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_session),
+):
     """Login view.
 
     Return token
     """
-    access_token = create_access_token(current_user.id, settings.SECRET_KEY, {"minutes": 3600})
-
-    async with session:
-        query = select(UserToken).where(UserToken.user_id == current_user.id)
-        result = await session.execute(query)
-        user_token: UserToken = result.scalars().first()
-        if user_token:
-            user_token.token = access_token
-        else:
-            user_token = UserToken(user_id=current_user.id, token=access_token)
-            session.add(user_token)
-        await session.commit()
+    # Take the write lock before reading the current token: a login of the same user on another
+    # worker waits for this one to commit, so no two logins issue the same generation
+    lock = update(UserToken).where(UserToken.user_id == current_user.id).values(token=UserToken.token)
+    await session.execute(lock.execution_options(synchronize_session=False))
+    query = select(UserToken).where(UserToken.user_id == current_user.id)
+    result = await session.execute(query)
+    user_token: UserToken = result.scalars().first()
+    revoked_token = user_token.token if user_token else None
+    generation = token_generation(revoked_token, settings.SECRET_KEY) + 1 if revoked_token else 1
+    access_token = create_access_token(
+        current_user.id, settings.SECRET_KEY, {"minutes": 3600}, generation, current_user.username
+    )
+    if user_token:
+        user_token.token = access_token
+    else:
+        user_token = UserToken(user_id=current_user.id, token=access_token)
+        session.add(user_token)
+    bus.publish(session, "token", token_event(current_user.id, generation, revoked_token))
+    await session.commit()
+    # Drop the revoked token once committed; lookups that read it before are not cached (see TTLCache.version)
+    if revoked_token:
+        principal_cache.pop(token_digest(revoked_token))
+    token_generations.set(current_user.id, generation)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-def create_access_token(user_id: int, key: str, expiry_time: dict) -> str:
-    """Create an access token."""
+def create_access_token(user_id: int, key: str, expiry_time: dict, generation: int = None, username: str = None) -> str:
+    """Create an access token.
+
+    The generation and username let the token be verified without a database lookup.
+    """
     expiry = datetime.datetime.utcnow() + datetime.timedelta(**expiry_time)
-    return jwt.encode({"id": user_id, "exp": expiry}, key)
+    claims = {"id": user_id, "exp": expiry}
+    if generation:
+        claims.update(gen=generation, name=username)
+    return jwt.encode(claims, key)
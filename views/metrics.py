@@ -0,0 +1,12 @@
+"""Metrics endpoint."""
+from fastapi import APIRouter, Response
+
+from services.metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -1,16 +1,21 @@
 """View for users register."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.engine import session
+from database.engine import get_session
 from database.models import User
+from services.hashing import hash_pool
+from services.invalidation import bus
 from validators.validation import ValidationError, validate
-from database.schemas import UserData
+from database.schemas import Message, UserData
+from views.users_list import users_cache
 
 router = APIRouter(tags=["registration"])
 
 
-@router.post("/registration", status_code=201)
-async def register_user(data: UserData):
+@router.post("/registration", status_code=201, response_model=Message)
+async def register_user(data: UserData, session: AsyncSession = Depends(get_session)):
     """New user registration.
 
     Requires a json with username and plain password in request body.
@@ -20,8 +25,16 @@ async def register_user(data: UserData):
     except ValidationError as e:
         raise HTTPException(status_code=400, detail=e.args[0])
 
-    user = User(data.username, data.password)
-    async with session:
-        session.add(user)
+    password_hash = await hash_pool.hash(data.password)
+    user = User(data.username, password_hash, hashed=True)
+    session.add(user)
+    bus.publish(session, "users")
+    try:
         await session.commit()
-        return {"message": f"User {user.username} was successfully registered"}
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=400, detail=f"Username '{data.username}' has been already registered by another user"
+        )
+    users_cache.invalidate()
+    return {"message": f"User {user.username} was successfully registered"}
@@ -0,0 +1,71 @@
+"""View for pending item transfers."""
+import time
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Settings, get_settings
+from database.engine import get_read_session
+from database.models import Item, PendingTransfer, User
+from database.schemas import CurrentUser, IncomingTransfers
+from validators.authentication import get_current_user
+from views.items import generate_exchange_token
+
+router = APIRouter(prefix="/transfers", tags=["items_exchange"])
+
+
+@router.get("/incoming", response_model=IncomingTransfers)
+async def incoming_transfers(
+    limit: int = Query(None, ge=1, le=get_settings().TRANSFERS_PAGE_SIZE_MAX),
+    after: int = Query(None, ge=0),
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Get the items offered to the user and not claimed yet, oldest offer first, one page at a time.
+
+    Pass `next_cursor` of a page as `after` to get the next one; it is null on the last page.
+    Pages are read from the achiever index; expired offers and items their sender no longer
+    owns are left out. Every transfer comes with the link claiming it.
+    """
+    if current_user:
+        limit = limit or settings.TRANSFERS_PAGE_SIZE
+        query = (
+            select(
+                PendingTransfer.id,
+                PendingTransfer.item_id,
+                PendingTransfer.owner_id,
+                PendingTransfer.expires,
+                Item.title,
+                User.username,
+            )
+            .join(Item, and_(Item.id == PendingTransfer.item_id, Item.user_id == PendingTransfer.owner_id))
+            .join(User, User.id == PendingTransfer.owner_id)
+            .where(PendingTransfer.achiever_id == current_user.id, PendingTransfer.expires > time.time())
+            .order_by(PendingTransfer.id)
+            .limit(limit + 1)
+        )
+        if after is not None:
+            query = query.where(PendingTransfer.id > after)
+        result = await session.execute(query)
+        rows = result.fetchall()
+        next_cursor = rows[limit - 1].id if len(rows) > limit else None
+
+        transfers = []
+        for transfer_id, item_id, owner_id, expires, title, sender in rows[:limit]:
+            token = generate_exchange_token(
+                owner_id, current_user.id, item_id, settings.SECRET_KEY, transfer_id, expires
+            )
+            transfers.append(
+                {
+                    "id": transfer_id,
+                    "item_id": item_id,
+                    "title": title,
+                    "sender": sender,
+                    "expires": int(expires),
+                    "link": f"/api/v1/get?transfer_key={token}",
+                }
+            )
+        return ORJSONResponse({"transfers": transfers, "next_cursor": next_cursor})
@@ -1,8 +1,18 @@
 """View for list of users."""
-from fastapi import APIRouter, Depends
+import hashlib
+import sys
 
-from database.engine import session
+import orjson
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Settings, get_settings
+from database.engine import get_read_session
 from database.models import User
+from database.schemas import CurrentUser, UsersPage
+from services.cache import TTLCache, etag_matches
+from services.invalidation import bus
 from sqlalchemy import select
 
 from validators.authentication import get_current_user
@@ -10,17 +20,103 @@ from validators.authentication import get_current_user
 router = APIRouter(tags=["users"])
 
 
-@router.get("/users")
-async def users_list(current_user: User = Depends(get_current_user)):
-    """Get list of users' usernames.
+class UsersListCache:
+    """Serialized full list of usernames with its ETag.
+
+    Registration invalidates it, in other workers through the invalidation bus;
+    the TTL only bounds staleness of changes made outside the app.
+    """
+
+    key = "users"
+
+    def __init__(self, ttl: float):
+        self.version = 0
+        self.entries = TTLCache(maxsize=1, ttl=ttl, name="users_list")
+
+    def get(self):
+        """Return (etag, body) or None."""
+        return self.entries.get(self.key)
+
+    def set(self, body: bytes, version: int):
+        """Store body unless the list was invalidated since `version` had been read."""
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if version == self.version:
+            self.entries.set(self.key, (etag, body))
+        return etag, body
+
+    def invalidate(self):
+        self.version += 1
+        self.entries.clear()
+
+
+users_cache = UsersListCache(get_settings().USERS_CACHE_TTL)
+bus.subscribe("users", lambda key: users_cache.invalidate())
+
+
+@router.get("/users", response_model=UsersPage)
+async def users_list(
+    request: Request,
+    limit: int = Query(None, ge=1, le=get_settings().USERS_PAGE_SIZE_MAX),
+    after: str = None,
+    prefix: str = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Get list of users' usernames ordered by username.
 
     With aim to forward an item to any other user
     one should know the exact username of the achiever.
+
+    Without parameters the whole list is returned from cache with an ETag;
+    a matching If-None-Match gets 304.
+    With any of `limit`, `after` or `prefix` a page is returned instead:
+    pass its `next_cursor` as `after` to get the next one.
     """
     if current_user:
-        async with session:
-            query = select(User.username)
-            result = await session.execute(query)
+        if limit is None and after is None and prefix is None:
+            return await full_users_list(request, session)
+
+        limit = limit or settings.USERS_PAGE_SIZE
+        query = select(User.username).order_by(User.username).limit(limit + 1)
+        if after is not None:
+            query = query.where(User.username > after)
+        if prefix:
+            query = query.where(User.username >= prefix)
+            upper_bound = prefix_upper_bound(prefix)
+            if upper_bound is not None:
+                query = query.where(User.username < upper_bound)
+        result = await session.execute(query)
         users = result.scalars().fetchall()
+        next_cursor = users[limit - 1] if len(users) > limit else None
+        return ORJSONResponse({"existing_users": users[:limit], "next_cursor": next_cursor})
+
 
-        return {"existing_users": users}
+async def full_users_list(request: Request, session: AsyncSession) -> Response:
+    """Serve the cached full list, answering conditional requests with 304."""
+    cached = users_cache.get()
+    if cached is None:
+        version = users_cache.version
+        result = await session.execute(select(User.username).order_by(User.username))
+        body = orjson.dumps({"existing_users": result.scalars().fetchall()})
+        cached = users_cache.set(body, version)
+    etag, body = cached
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def prefix_upper_bound(prefix: str):
+    """Smallest string greater than every string starting with prefix, or None when there is none.
+
+    `prefix <= username < upper bound` is a range scan on the username index, unlike LIKE.
+    Trailing characters at the highest code point can't be incremented and carry over to the
+    previous one; surrogates, which can't be stored, are skipped.
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return None
+    code_point = ord(stem[-1]) + 1
+    if 0xD800 <= code_point <= 0xDFFF:
+        code_point = 0xE000
+    return stem[:-1] + chr(code_point)